@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for LinkedIn Sales Automation Tool
+
+Everything runs against temp databases with the fake model backend, so no API
+key or network access is needed:
+
+    python benchmark.py
+    python benchmark.py --sizes 100 10000 --generate 1000 --latency 0.2 --error-rate 0.05
+    python benchmark.py --imports-only
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+DEFAULT_SIZES = [100, 10_000, 100_000]
+BENCHMARK_PAGES = ["🏠 Dashboard", "📈 Campaign Management", "📊 Analytics"]
+
+# Cold start: modules imported in a fresh interpreter, and the heavy dependencies
+# that must stay deferred until first use
+IMPORT_MODULES = ["linkedin_automation", "linkedin_automation.cli", "app"]
+DEFERRED_MODULES = ["pandas", "google.generativeai"]
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {deferred!r} if name in sys.modules])
+"""
+
+CAMPAIGN = {
+    'name': 'Benchmark Campaign',
+    'product_description': 'HR automation platform that reduces manual work by 60%',
+    'target_industry': 'SaaS',
+    'target_roles': 'HR Manager, CTO',
+    'company_size': 'SME (50-500 employees)',
+    'region': 'India',
+    'outreach_goal': 'Book a demo',
+    'brand_voice': 'Friendly',
+    'triggers': ''
+}
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+def make_rows(count: int, start: int = 0) -> List[Dict]:
+    return [
+        {'name': f'Prospect {i}', 'title': 'HR Manager', 'company': f'Company {i % 500}',
+         'industry': 'SaaS', 'profile_url': f'https://www.linkedin.com/in/prospect-{i}',
+         'profile_summary': 'Experienced HR professional focused on hybrid work culture.'}
+        for i in range(start, start + count)
+    ]
+
+def bench_generation(count: int, concurrency: int, latency: float, error_rate: float,
+                     tokens_per_second: float, seed: int, slow_rate: float = 0.0) -> Dict[str, Dict[str, float]]:
+    """Prospects/second and per-request latency for the concurrent and batched paths.
+
+    'hedged' is the concurrent path through a ModelRouter with a second fake model,
+    showing how hedging trims the latency tail when slow_rate of calls are slow.
+    """
+    from linkedin_automation.generation import (GeminiClient, MessageGenerator, ModelRouter, Prospect,
+                                                ResponseCache)
+    from linkedin_automation.model_backends import FakeBackend
+
+    def make_client(backend):
+        return GeminiClient(backend, requests_per_minute=10 ** 9, base_delay=0.01, max_delay=0.05)
+
+    results = {}
+    for mode in ('concurrent', 'batched', 'hedged'):
+        backends = [FakeBackend(latency=latency, error_rate=error_rate, tokens_per_second=tokens_per_second,
+                                seed=seed, slow_rate=slow_rate)]
+        client = make_client(backends[0])
+        if mode == 'hedged':
+            backends.append(FakeBackend(latency=latency, error_rate=error_rate, tokens_per_second=tokens_per_second,
+                                        seed=seed + 1, slow_rate=slow_rate, model_name='models/fake-fallback'))
+            client = ModelRouter(client, make_client(backends[1]))
+        generator = MessageGenerator("benchmark", cache=ResponseCache(os.path.abspath("bench_cache.db")),
+                                     client=client)
+
+        latencies = []
+        generate_text = client.generate_text
+
+        def timed_generate_text(prompt, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return generate_text(prompt, *args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        client.generate_text = timed_generate_text
+
+        prospects = [Prospect(name=row['name'], title=row['title'], company=row['company'],
+                              industry=row['industry'], profile_summary=row['profile_summary'])
+                     for row in make_rows(count)]
+        start = time.perf_counter()
+        if mode != 'batched':
+            outcomes = generator.generate_many(prospects, CAMPAIGN, max_concurrency=concurrency,
+                                               use_cache=False, return_exceptions=True)
+        else:
+            outcomes = generator.generate_batched(prospects, CAMPAIGN, max_concurrency=concurrency,
+                                                  use_cache=False, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+        results[mode] = {
+            'prospects_per_second': count / elapsed,
+            'requests': sum(backend.calls for backend in backends),
+            'failed': sum(isinstance(outcome, Exception) for outcome in outcomes),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000
+        }
+    return results
+
+def bench_dedupe(count: int, seed: int) -> Dict[str, float]:
+    """Near-duplicate check of a campaign's connection messages, a tenth of them from one template"""
+    import random
+    from linkedin_automation.dedupe import find_campaign_duplicates
+
+    rng = random.Random(seed)
+    words = CAMPAIGN['product_description'].split() + make_rows(1)[0]['profile_summary'].split()
+    prospects = [
+        {'id': i, 'name': row['name'], 'company': row['company'], 'status': 'draft',
+         'connection_message': (f"Hi {row['name']}, I'd love to connect and hear how {row['company']} "
+                                f"handles hybrid work culture." if i % 10 == 0
+                                else " ".join(rng.choice(words) for _ in range(40)))}
+        for i, row in enumerate(make_rows(count))
+    ]
+    report = find_campaign_duplicates(0, prospects=prospects)
+    return {'messages_per_second': count / report.seconds, 'seconds': report.seconds,
+            'groups': len(report.groups), 'flagged': len(report.flagged)}
+
+def bench_database(size: int) -> Dict[str, float]:
+    """Bulk import rate, and the rate of saving generated messages for a tenth of the rows"""
+    from linkedin_automation import database
+
+    database.init_db()
+    campaign_id = database.save_campaign(CAMPAIGN)
+
+    start = time.perf_counter()
+    database.save_prospects_bulk(make_rows(size), campaign_id)
+    import_rate = size / (time.perf_counter() - start)
+
+    generated = [dict(row, connection_message=f"Hi {row['name']}", follow_up_messages=['One', 'Two', 'Three'])
+                 for row in make_rows(max(1, size // 10))]
+    start = time.perf_counter()
+    database.save_prospects_bulk(generated, campaign_id)
+    generated_rate = len(generated) / (time.perf_counter() - start)
+
+    return {'import_rows_per_second': import_rate, 'generated_rows_per_second': generated_rate}
+
+def bench_pages(pages: List[str] = BENCHMARK_PAGES) -> Dict[str, Dict[str, float]]:
+    """Render time of each page, cold (first visit) and warm (a rerun with cached queries)"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, "app.py"), default_timeout=600).run()
+    results = {}
+    for page in pages:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            at.sidebar.selectbox[0].set_value(page).run()
+            timings.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception[0].value}")
+        results[page] = {'cold_ms': timings[0] * 1000, 'warm_ms': timings[1] * 1000}
+    return results
+
+def bench_imports(modules: List[str] = IMPORT_MODULES, runs: int = 5) -> Dict[str, Dict]:
+    """Import time of each module in a fresh interpreter, and which deferred modules it loaded"""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, LINKEDIN_AUTOMATION_MODEL_BACKEND='gemini')
+    results = {}
+    for module in modules:
+        timings = []
+        for _ in range(runs):
+            # Run in the (temp) working directory: importing app.py creates its database there
+            output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module, deferred=DEFERRED_MODULES)],
+                                    env=env, capture_output=True, text=True, check=True).stdout.split()
+            timings.append(float(output[0]))
+        results[module] = {'median_ms': statistics.median(timings) * 1000, 'min_ms': min(timings) * 1000,
+                           'loaded': output[1:]}
+    return results
+
+def run_benchmarks(sizes: List[int] = DEFAULT_SIZES, generate: int = 500, concurrency: int = 16,
+                   latency: float = 0.05, error_rate: float = 0.0, tokens_per_second: float = 2000.0,
+                   seed: int = 0, import_runs: int = 5, dedupe: int = 50_000, slow_rate: float = 0.02) -> Dict:
+    """Run every benchmark in a temp folder and return the measurements"""
+    from linkedin_automation import config, database
+
+    # Offline: AppTest runs of app.py pick up the fake backend and the temp databases
+    previous_backend, config.MODEL_BACKEND = config.MODEL_BACKEND, 'fake'
+    results = {'sizes': {}}
+    previous_dir = os.getcwd()
+    previous_db = database.DB_PATH
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results['imports'] = bench_imports(runs=import_runs)
+
+            database.DB_PATH = os.path.join(workdir, "generation.db")
+            database.init_db()
+            results['generation'] = bench_generation(generate, concurrency, latency, error_rate,
+                                                     tokens_per_second, seed, slow_rate)
+            results['dedupe'] = bench_dedupe(dedupe, seed)
+
+            for size in sizes:
+                database.DB_PATH = os.path.join(workdir, f"prospects_{size}.db")
+                results['sizes'][size] = {'database': bench_database(size), 'pages': bench_pages()}
+        finally:
+            database.close_connections()
+            database.DB_PATH = previous_db
+            config.MODEL_BACKEND = previous_backend
+            os.chdir(previous_dir)
+    return results
+
+def print_imports(imports: Dict):
+    print("\n🧊 Cold start (fresh interpreter)")
+    for module, stats in imports.items():
+        loaded = f"  ⚠️ loaded {', '.join(stats['loaded'])}" if stats['loaded'] else ""
+        print(f"  import {module:<24} median {stats['median_ms']:>7.1f} ms  min {stats['min_ms']:>7.1f} ms{loaded}")
+
+def deferred_imports_loaded(imports: Dict) -> bool:
+    return any(stats['loaded'] for stats in imports.values())
+
+def print_report(results: Dict):
+    print_imports(results['imports'])
+    print("\n⚡ Generation (fake backend)")
+    for mode, stats in results['generation'].items():
+        print(f"  {mode:<11} {stats['prospects_per_second']:>9.1f} prospects/s  "
+              f"p50 {stats['p50_ms']:>7.1f} ms  p99 {stats['p99_ms']:>7.1f} ms  "
+              f"{stats['requests']} requests, {stats['failed']} failed")
+
+    stats = results['dedupe']
+    print(f"\n🔁 Near-duplicate check: {stats['messages_per_second']:,.0f} messages/s "
+          f"({stats['seconds']:.2f} s, {stats['groups']} groups, {stats['flagged']} flagged)")
+
+    for size, stats in results['sizes'].items():
+        db_stats = stats['database']
+        print(f"\n🗄️ {size:,} prospects")
+        print(f"  import            {db_stats['import_rows_per_second']:>10.0f} rows/s")
+        print(f"  generated saves   {db_stats['generated_rows_per_second']:>10.0f} rows/s")
+        for page, timings in stats['pages'].items():
+            print(f"  {page:<24} cold {timings['cold_ms']:>8.1f} ms  warm {timings['warm_ms']:>8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput and latency benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="prospect counts for the database and page render benchmarks")
+    parser.add_argument("--generate", type=int, default=500, help="prospects to generate")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--dedupe", type=int, default=50_000, help="messages for the near-duplicate check")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failing fake calls")
+    parser.add_argument("--slow-rate", type=float, default=0.02,
+                        help="fraction of fake calls taking 10x the latency (the tail hedging cuts)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--imports-only", action="store_true", help="only measure cold start import time")
+    args = parser.parse_args()
+
+    print("🚀 LinkedIn Sales Automation Tool - Benchmarks")
+    print("=" * 60)
+    if args.imports_only:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            imports = bench_imports()
+        print_imports(imports)
+    else:
+        results = run_benchmarks(args.sizes, args.generate, args.concurrency, args.latency,
+                                 args.error_rate, args.tokens_per_second, args.seed,
+                                 dedupe=args.dedupe, slow_rate=args.slow_rate)
+        print_report(results)
+        imports = results['imports']
+    # A cold start that loads pandas or the Gemini SDK is a regression, even if it's fast here
+    if deferred_imports_loaded(imports):
+        sys.exit(f"\n❌ Deferred modules were loaded at import: {', '.join(DEFERRED_MODULES)} must stay lazy")
+
+if __name__ == "__main__":
+    main()
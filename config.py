@@ -1,2 +0,0 @@
-# Basic configuration
-GEMINI_API_KEY = 'your api'
@@ -0,0 +1,170 @@
+"""
+Shared fixtures for the test suite
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import database, generation
+
+CAMPAIGN = {
+    'name': 'Test Campaign',
+    'product_description': 'HR automation',
+    'target_industry': 'SaaS',
+    'target_roles': 'CTO',
+    'company_size': 'SME',
+    'region': 'India',
+    'outreach_goal': 'Book a demo',
+    'brand_voice': 'Friendly',
+    'triggers': ''
+}
+
+@pytest.fixture
+def campaign_data():
+    """A campaign to save, copied so tests can change it freely"""
+    return dict(CAMPAIGN)
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    """Point the data layer at a fresh temp database and close this thread's connections afterwards"""
+    path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    yield path
+    database.close_connections()
+
+# Stand-ins for genai.GenerativeModel, shared by the generation tests
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel that echoes the prospect name"""
+
+    model_name = "models/fake"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self.lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        name = prompt.split("- Name: ")[1].split("\n")[0]
+        return FakeResponse(f"Hi {name}")
+
+class ScriptedModel(FakeModel):
+    """Fake model whose reply is computed by a function of (prompt, kwargs)"""
+
+    def __init__(self, reply):
+        super().__init__()
+        self.reply = reply
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+        return FakeResponse(self.reply(prompt, kwargs))
+
+class ApiError(Exception):
+    """Mimics google.api_core exceptions, which carry an HTTP status code"""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class FlakyModel(FakeModel):
+    """Raises the queued errors before answering normally"""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def generate_content(self, prompt, **kwargs):
+        with self.lock:
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            with self.lock:
+                self.calls += 1
+            raise error
+        return super().generate_content(prompt, **kwargs)
+
+class PrefixAwareModel(FakeModel):
+    """Fake model that supports system instructions, recording what each call received"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def with_system_instruction(self, system_instruction):
+        model = self
+
+        class Variant:
+            model_name = model.model_name
+
+            def generate_content(self, prompt, **kwargs):
+                model.requests.append((system_instruction, prompt))
+                return model.generate_content(prompt, **kwargs)
+
+        return Variant()
+
+class StreamingModel(FakeModel):
+    """Streams its reply word by word when called with stream=True"""
+
+    def __init__(self, errors=()):
+        super().__init__()
+        self.errors = list(errors)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self.lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        name = prompt.split("- Name: ")[1].split("\n")[0]
+        if "follow-up messages" in prompt:
+            text = "FOLLOW-UP 1: One FOLLOW-UP 2: Two FOLLOW-UP 3: Three"
+        else:
+            text = f"Hi {name}, great to meet you"
+        if not stream:
+            return FakeResponse(text)
+        return iter([FakeResponse(word + " ") for word in text.split(" ")])
+
+class NamedModel(FakeModel):
+    """FakeModel under another model name, answering with that name"""
+
+    def __init__(self, model_name, errors=()):
+        super().__init__()
+        self.model_name = model_name
+        self.errors = list(errors)
+
+    def generate_content(self, prompt, **kwargs):
+        with self.lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        return FakeResponse(f"{self.model_name} reply")
+
+@pytest.fixture
+def make_generator(tmp_path):
+    """Build a MessageGenerator wired to a fake model, a temp response cache and no rate limit"""
+    def make(fake, cache=None, **client_options):
+        client_options.setdefault("requests_per_minute", 600000)
+        client = generation.GeminiClient(fake, **client_options)
+        client.sleep = lambda seconds: None
+        cache = cache if cache is not None else generation.ResponseCache(str(tmp_path / "cache.db"))
+        return generation.MessageGenerator("test", cache=cache, client=client)
+    return make
@@ -0,0 +1,20 @@
+"""
+LinkedIn Sales Automation Tool core
+
+Message generation, storage and import, usable without Streamlit. The web UI
+lives in app.py; `python -m linkedin_automation` runs the headless CLI.
+"""
+
+from .generation import (
+    Prospect, MessageGenerator, JobWorker, GeminiClient, ResponseCache, GenerationError,
+    RateLimitError, ModelUnavailableError, CircuitOpenError, FollowUpParseError,
+    BudgetExceededError
+)
+from .database import init_db, save_campaign, load_campaign, save_prospect, save_prospects_bulk
+
+__all__ = [
+    'Prospect', 'MessageGenerator', 'JobWorker', 'GeminiClient', 'ResponseCache', 'GenerationError',
+    'RateLimitError', 'ModelUnavailableError', 'CircuitOpenError', 'FollowUpParseError',
+    'BudgetExceededError',
+    'init_db', 'save_campaign', 'load_campaign', 'save_prospect', 'save_prospects_bulk'
+]
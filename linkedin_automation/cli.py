@@ -0,0 +1,263 @@
+"""
+Headless command line interface
+
+    python -m linkedin_automation campaigns
+    python -m linkedin_automation generate --campaign 3 --input prospects.csv --concurrency 16
+    python -m linkedin_automation worker
+    python -m linkedin_automation dedupe --campaign 3 --regenerate
+    python -m linkedin_automation export --campaign 3 --output messages.parquet
+    python -m linkedin_automation due
+    python -m linkedin_automation compact
+
+`generate` imports the file into the campaign, queues every pending prospect
+as a job and processes it in this process. Progress is committed per
+prospect, so an interrupted run picks up where it stopped when re-run.
+`worker` processes jobs queued from the web UI until interrupted. `dedupe`
+reports near-duplicate connection messages and can queue the unsent copies
+for regeneration. `export` streams a campaign's prospects and messages to
+CSV or Parquet. `due` lists the messages due now within today's sending limits.
+`compact` rebuilds the daily stats rollup from the prospects and messages.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+from . import database
+from .config import GEMINI_API_KEY
+from .generation import (DEFAULT_MAX_CONCURRENCY, ConfigurationError, JobWorker, MessageGenerator,
+                         get_gemini_client)
+from .prospect_import import REQUIRED_FIELDS, guess_mapping, import_prospects, open_rows
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+class ProgressPrinter:
+    """Prints a progress line at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.counts = {'done': 0, 'failed': 0, 'paused': 0}
+        self.started = time.monotonic()
+        self.last_printed = self.started
+
+    def __call__(self, job_id: int, outcome: str):
+        self.counts[outcome] += 1
+        now = time.monotonic()
+        if now - self.last_printed >= PROGRESS_INTERVAL:
+            self.last_printed = now
+            self.print_line(job_id)
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.counts['done'] + self.counts['failed']) / elapsed if elapsed else 0.0
+
+    def print_line(self, job_id: int):
+        print(f"[job {job_id}] {self.counts['done']}/{self.total} generated, "
+              f"{self.counts['failed']} failed ({self.rate:.1f} prospects/s)", flush=True)
+
+def import_file(path: str, campaign_id: int) -> bool:
+    with open(path, 'rb') as file:
+        columns, rows = open_rows(file, os.path.basename(path))
+        mapping = guess_mapping(columns)
+        missing = [field for field in REQUIRED_FIELDS if not mapping.get(field)]
+        if missing:
+            print(f"❌ {path}: no column found for {', '.join(missing)} "
+                  f"(columns: {', '.join(columns)})", file=sys.stderr)
+            return False
+
+        result = import_prospects(rows, mapping, campaign_id)
+
+    print(f"📥 Imported {result.imported} prospects, skipped {result.skipped}")
+    for row_number, error in result.errors[:10]:
+        print(f"   row {row_number}: {error}")
+    return True
+
+def model_configured() -> bool:
+    """Create the model client up front, printing why if it can't be"""
+    try:
+        get_gemini_client()
+    except ConfigurationError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return False
+    return True
+
+def cmd_campaigns(args) -> int:
+    stats = database.load_campaign_stats()
+    usage = database.load_token_usage()
+    for campaign in database.load_campaign_repository():
+        counts = stats.get(campaign['id'], {'total': 0})
+        tokens = usage.get(campaign['id'], {'input_tokens': 0, 'output_tokens': 0})
+        budget = f" of {campaign['token_budget']:,}" if campaign['token_budget'] else ""
+        print(f"{campaign['id']:>5}  {campaign['name']}  ({counts['total']} prospects, "
+              f"{counts.get('pending', 0)} pending, "
+              f"{tokens['input_tokens'] + tokens['output_tokens']:,}{budget} tokens)")
+    return 0
+
+def cmd_generate(args) -> int:
+    if not model_configured():
+        return 2
+    if database.load_campaign(args.campaign) is None:
+        print(f"❌ Campaign {args.campaign} not found", file=sys.stderr)
+        return 2
+
+    if args.input and not import_file(args.input, args.campaign):
+        return 2
+
+    job_id = database.queue_pending_prospects(args.campaign, args.concurrency)
+    if job_id is None:
+        print("✅ No pending prospects to generate")
+        return 0
+
+    job = database.load_job(job_id)
+    progress = ProgressPrinter(job['total'])
+    worker = JobWorker(MessageGenerator(GEMINI_API_KEY), poll_interval=args.poll_interval,
+                       progress_callback=progress)
+    print(f"🤖 Generating {job['total']} prospects as job {job_id} "
+          f"(concurrency {args.concurrency})", flush=True)
+
+    try:
+        status = None
+        while status not in ('completed', 'failed', 'over_budget'):
+            status = worker.run_job(job_id)
+            if status is None:
+                # Another worker (e.g. the web UI's) claimed it; wait for it to finish
+                time.sleep(args.poll_interval)
+                status = database.load_job(job_id)['status']
+    except KeyboardInterrupt:
+        worker.stop()
+        database.set_job_status(job_id, 'pending')
+        print(f"\n⏸️ Interrupted; job {job_id} stays queued and resumes on the next run")
+        return 130
+
+    progress.print_line(job_id)
+    job = database.load_job(job_id)
+    if status == 'over_budget':
+        print(f"💸 Job {job_id} stopped: campaign {args.campaign} has used its token budget "
+              f"({job['completed']} generated). Raise the budget to resume it.")
+        return 1
+    print(f"{'✅' if status == 'completed' else '❌'} Job {job_id} {status}: "
+          f"{job['completed']} generated, {job['failed']} failed")
+    return 0 if status == 'completed' and job['failed'] == 0 else 1
+
+def cmd_dedupe(args) -> int:
+    # Imported here so the other commands don't load NumPy
+    from .dedupe import DEFAULT_THRESHOLD, find_campaign_duplicates
+
+    if database.load_campaign(args.campaign) is None:
+        print(f"❌ Campaign {args.campaign} not found", file=sys.stderr)
+        return 2
+
+    threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+    report = find_campaign_duplicates(args.campaign, threshold)
+    print(f"🔁 Checked {report.checked} messages in {report.seconds:.2f}s: "
+          f"{len(report.groups)} near-duplicate groups, {len(report.flagged)} unsent messages flagged")
+    for group in report.groups[:10]:
+        print(f"   {len(group)} x {group[0]['connection_message'][:80]!r}")
+
+    if args.regenerate and report.flagged:
+        job_id = database.queue_regeneration(args.campaign, report.flagged, args.concurrency)
+        if job_id is not None:
+            print(f"♻️ Queued job {job_id}; run `worker` (or the web UI) to regenerate them")
+    return 0
+
+def cmd_export(args) -> int:
+    from .export import export_campaign
+
+    if database.load_campaign(args.campaign) is None:
+        print(f"❌ Campaign {args.campaign} not found", file=sys.stderr)
+        return 2
+
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    columns = args.columns.split(',') if args.columns else None
+    try:
+        rows = export_campaign(args.campaign, args.output, fmt, columns)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    print(f"📤 Exported {rows} prospects to {args.output}")
+    return 0
+
+def cmd_due(args) -> int:
+    from .scheduler import OutreachScheduler
+
+    scheduler = OutreachScheduler(args.account_type) if args.account_type else OutreachScheduler()
+    usage = scheduler.usage()
+    for message_type, messages in scheduler.due_now().items():
+        print(f"📬 {message_type}: {usage[message_type]['sent']}/{usage[message_type]['limit']} sent today, "
+              f"{len(messages)} due now")
+        for message in messages:
+            step = f" #{message['sequence_number']}" if message_type == 'follow_up' else ""
+            print(f"   {message['name']} ({message['company']}){step}  {message['profile_url'] or ''}")
+    return 0
+
+def cmd_compact(args) -> int:
+    rows = database.compact_daily_stats()
+    print(f"🧹 Rebuilt the daily stats rollup: {rows} campaign days")
+    return 0
+
+def cmd_worker(args) -> int:
+    if not model_configured():
+        return 2
+    worker = JobWorker(MessageGenerator(GEMINI_API_KEY), poll_interval=args.poll_interval)
+    print("👷 Processing queued jobs (Ctrl+C to stop)", flush=True)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m linkedin_automation",
+                                     description="LinkedIn Sales Automation Tool (headless)")
+    parser.add_argument("--db", help="database file (defaults to LINKEDIN_AUTOMATION_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("campaigns", help="list campaigns and their prospect counts")
+
+    generate = commands.add_parser("generate", help="import prospects and generate their messages")
+    generate.add_argument("--campaign", type=int, required=True, help="campaign id")
+    generate.add_argument("--input", help="CSV or Excel prospect list to import first")
+    generate.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    generate.add_argument("--poll-interval", type=float, default=5.0,
+                          help="seconds to wait while the API is paused or rate limited")
+
+    dedupe = commands.add_parser("dedupe", help="find near-duplicate connection messages")
+    dedupe.add_argument("--campaign", type=int, required=True, help="campaign id")
+    # Defaults to dedupe.DEFAULT_THRESHOLD, resolved in cmd_dedupe so building the parser doesn't load NumPy
+    dedupe.add_argument("--threshold", type=float,
+                        help="estimated similarity (0-1) from which messages count as duplicates "
+                             "(default: the same threshold as the web UI)")
+    dedupe.add_argument("--regenerate", action="store_true",
+                        help="queue a job regenerating the flagged unsent messages")
+    dedupe.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+
+    export = commands.add_parser("export", help="export a campaign's prospects and messages")
+    export.add_argument("--campaign", type=int, required=True, help="campaign id")
+    export.add_argument("--output", required=True, help="file to write")
+    export.add_argument("--format", choices=['csv', 'parquet'],
+                        help="defaults to parquet for a .parquet output, otherwise csv")
+    export.add_argument("--columns", help="comma separated columns (defaults to the main ones)")
+
+    due = commands.add_parser("due", help="list messages due now within today's sending limits")
+    due.add_argument("--account-type", choices=['free', 'premium'],
+                     help="defaults to LINKEDIN_AUTOMATION_ACCOUNT_TYPE")
+
+    commands.add_parser("compact", help="rebuild the daily stats rollup from the raw tables")
+
+    worker = commands.add_parser("worker", help="process jobs queued from the web UI")
+    worker.add_argument("--poll-interval", type=float, default=5.0)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.db:
+        database.DB_PATH = args.db
+    database.ensure_db()
+
+    commands = {'campaigns': cmd_campaigns, 'generate': cmd_generate, 'dedupe': cmd_dedupe,
+                'export': cmd_export, 'due': cmd_due, 'compact': cmd_compact, 'worker': cmd_worker}
+    return commands[args.command](args)
@@ -0,0 +1,37 @@
+# Basic configuration
+import os
+
+# Set GEMINI_API_KEY in the environment; the gemini backend refuses to start without it
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+
+# Database files (override with environment variables for deployments/tests)
+DB_PATH = os.environ.get('LINKEDIN_AUTOMATION_DB', 'linkedin_automation.db')
+CACHE_DB_PATH = os.environ.get('LINKEDIN_AUTOMATION_CACHE_DB', 'response_cache.db')
+
+# Model backend: 'gemini', or 'fake' for the offline fake used by tests and benchmarks
+MODEL_BACKEND = os.environ.get('LINKEDIN_AUTOMATION_MODEL_BACKEND', 'gemini')
+
+# Model routing (opt-in): with a fallback model set, e.g. 'gemini-1.5-flash-8b', the
+# fallback takes over when the primary fails and gets a hedged copy of any request
+# slower than the primary's recent HEDGE_PERCENTILE latency
+GEMINI_MODEL = os.environ.get('LINKEDIN_AUTOMATION_MODEL', 'gemini-1.5-flash')
+FALLBACK_MODEL = os.environ.get('LINKEDIN_AUTOMATION_FALLBACK_MODEL', '')
+HEDGE_PERCENTILE = float(os.environ.get('LINKEDIN_AUTOMATION_HEDGE_PERCENTILE', '95'))
+
+# Gemini requests per minute for your API tier; 15 is the gemini-1.5-flash free tier.
+# Shared by every worker, so raise it before raising generation concurrency.
+REQUESTS_PER_MINUTE = float(os.environ.get('LINKEDIN_AUTOMATION_REQUESTS_PER_MINUTE', '15'))
+
+# Metrics: optional JSONL log of every observation and port for a Prometheus /metrics endpoint.
+# The endpoint listens on localhost only unless METRICS_HOST says otherwise (e.g. 0.0.0.0).
+METRICS_LOG_PATH = os.environ.get('LINKEDIN_AUTOMATION_METRICS_LOG')
+METRICS_PORT = int(os.environ.get('LINKEDIN_AUTOMATION_METRICS_PORT', '0'))
+METRICS_HOST = os.environ.get('LINKEDIN_AUTOMATION_METRICS_HOST', '127.0.0.1')
+
+# LinkedIn account type ('free' or 'premium') and its daily sending limits; the
+# scheduler never hands out more than these per day
+ACCOUNT_TYPE = os.environ.get('LINKEDIN_AUTOMATION_ACCOUNT_TYPE', 'free')
+DAILY_LIMITS = {
+    'free': {'connection': 15, 'follow_up': 50},
+    'premium': {'connection': 30, 'follow_up': 100},
+}
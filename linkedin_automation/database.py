@@ -0,0 +1,1030 @@
+"""
+Database access layer for LinkedIn Sales Automation Tool
+
+Every thread gets one long-lived SQLite connection per database file, opened in
+WAL mode so Streamlit sessions and the background worker can read while another
+thread writes. Keeping connections open also lets sqlite3's per-connection
+statement cache reuse prepared statements across calls.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from .config import DB_PATH
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT_MS = 30000
+CACHED_STATEMENTS = 256
+
+# Follow-up cadence, in days after the previous message: 2-3 days, 1 week, 2 weeks
+FOLLOW_UP_DELAYS_DAYS = [3, 7, 14]
+
+# Rows per page when browsing prospects
+PAGE_SIZE = 50
+
+# Rows per transaction for bulk prospect imports
+BULK_CHUNK_SIZE = 1000
+
+# Background generation jobs
+JOB_STALE_SECONDS = 5 * 60
+JOB_CHUNK_SIZE = 100
+
+_local = threading.local()
+
+# Files already switched to WAL by this process
+_wal_paths = set()
+_wal_lock = threading.Lock()
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=CACHED_STATEMENTS, isolation_level=None)
+    # Switching to WAL doesn't wait on the busy timeout, so threads opening a new file
+    # at once could fail with "database is locked"; the mode is stored in the file, so
+    # the first connection switches it under a lock and later ones skip the pragma
+    if path not in _wal_paths:
+        with _wal_lock:
+            if path not in _wal_paths:
+                conn.execute("PRAGMA journal_mode=WAL")
+                _wal_paths.add(path)
+    # NORMAL is durable in WAL mode except for the last commits on power loss
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+def get_connection(db_path=None):
+    """Return this thread's connection to db_path (defaults to config.DB_PATH)"""
+    path = os.path.abspath(db_path or DB_PATH)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _open_connection(path)
+    return conn
+
+def close_connections():
+    """Close every connection opened by the current thread"""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+@contextmanager
+def transaction(db_path=None):
+    """Run the block in a write transaction, committing on success"""
+    conn = get_connection(db_path)
+    start = time.perf_counter()
+    # Take the write lock up front so concurrent writers wait on busy_timeout
+    # instead of failing when a read transaction tries to upgrade
+    conn.execute("BEGIN IMMEDIATE")
+    metrics.observe('db_lock_wait_seconds', time.perf_counter() - start)
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        metrics.inc('db_rollbacks_total')
+        raise
+    conn.execute("COMMIT")
+    metrics.observe('db_operation_seconds', time.perf_counter() - start, kind='write')
+
+def bump_version(c, *tables):
+    """Count a write to tables, inside the writing transaction so it commits with it"""
+    c.executemany("""
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    """, [(table,) for table in tables])
+
+def data_version(*tables):
+    """Cache key for the given tables of the current database; changes on every write to them.
+
+    The counters live in the database, so writes from other processes (the CLI
+    worker, another app instance) change the key too.
+    """
+    rows = dict(get_connection().execute(
+        f"SELECT name, version FROM data_versions WHERE name IN ({', '.join('?' * len(tables))})",
+        tables).fetchall())
+    return (os.path.abspath(DB_PATH),) + tuple(rows.get(table, 0) for table in tables)
+
+def query(sql, params=(), db_path=None):
+    """Run a read query and return the rows as dicts"""
+    with metrics.timer('db_operation_seconds', kind='read'):
+        cursor = get_connection(db_path).execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_dataframe(sql, params=(), db_path=None):
+    # pandas takes about half a second to import; the CLI and worker never need it
+    import pandas as pd
+
+    with metrics.timer('db_operation_seconds', kind='read'):
+        return pd.read_sql_query(sql, get_connection(db_path), params=list(params))
+
+def _add_missing_columns(c, table, columns):
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in c.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+TODAY = "date('now', 'localtime')"
+
+# (trigger name, event, rollup column, day expression) for campaign_daily_stats
+ROLLUP_TRIGGERS = [
+    ('trg_rollup_prospect_added', "AFTER INSERT ON prospects",
+     'prospects_added', 'date(NEW.created_date)'),
+    ('trg_rollup_imported_with_message',
+     "AFTER INSERT ON prospects WHEN NEW.connection_message IS NOT NULL",
+     'messages_generated', 'date(NEW.created_date)'),
+    ('trg_rollup_message_generated',
+     "AFTER UPDATE OF connection_message ON prospects "
+     "WHEN OLD.connection_message IS NULL AND NEW.connection_message IS NOT NULL",
+     'messages_generated', TODAY),
+    ('trg_rollup_message_sent',
+     "AFTER UPDATE OF sent_date ON messages WHEN OLD.sent_date IS NULL AND NEW.sent_date IS NOT NULL",
+     'messages_sent', 'date(NEW.sent_date)'),
+    ('trg_rollup_sent_message_added', "AFTER INSERT ON messages WHEN NEW.sent_date IS NOT NULL",
+     'messages_sent', 'date(NEW.sent_date)'),
+    ('trg_rollup_reply',
+     "AFTER UPDATE OF response ON messages WHEN OLD.response IS NULL AND NEW.response IS NOT NULL",
+     'replies', TODAY),
+]
+
+def rebuild_daily_stats(c):
+    """Recompute campaign_daily_stats from the raw tables.
+
+    The triggers keep the rollup current; this is the compaction step for
+    backfilling and for repairing it after rows are deleted or edited by hand.
+    Generation and reply times aren't stored, so those are bucketed on the
+    prospect's created day and the message's sent day.
+    """
+    c.execute("DELETE FROM campaign_daily_stats")
+    c.execute("""
+        INSERT INTO campaign_daily_stats (campaign_id, day, prospects_added, messages_generated,
+                                          messages_sent, replies)
+        SELECT campaign_id, day, SUM(added), SUM(generated), SUM(sent), SUM(replied) FROM (
+            SELECT campaign_id, date(created_date) AS day, 1 AS added,
+                   connection_message IS NOT NULL AS generated, 0 AS sent, 0 AS replied
+            FROM prospects
+            UNION ALL
+            SELECT p.campaign_id, date(m.sent_date), 0, 0, 1, m.response IS NOT NULL
+            FROM messages m JOIN prospects p ON p.id = m.prospect_id
+            WHERE m.sent_date IS NOT NULL
+        )
+        WHERE day IS NOT NULL
+        GROUP BY campaign_id, day
+    """)
+
+def compact_daily_stats():
+    """Rebuild the rollup from the raw tables and return its row count.
+
+    Run by the `compact` CLI command to repair drift after rows are deleted
+    or edited outside the app, which the triggers don't subtract.
+    """
+    with transaction() as c:
+        rebuild_daily_stats(c)
+        bump_version(c, 'prospects', 'messages')
+        return c.execute("SELECT COUNT(*) FROM campaign_daily_stats").fetchone()[0]
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Never edit a released migration; append a new one instead.
+def _migration_1_base_schema(c):
+    # Create campaigns table
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            product_description TEXT,
+            target_industry TEXT,
+            target_roles TEXT,
+            company_size TEXT,
+            region TEXT,
+            outreach_goal TEXT,
+            brand_voice TEXT,
+            triggers TEXT,
+            created_date TEXT
+        )
+    """)
+
+    # Create prospects table
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS prospects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER,
+            name TEXT,
+            title TEXT,
+            company TEXT,
+            industry TEXT,
+            profile_url TEXT,
+            connection_message TEXT,
+            follow_up_messages TEXT,
+            status TEXT,
+            created_date TEXT,
+            FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
+        )
+    """)
+
+    # Create messages table
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prospect_id INTEGER,
+            message_type TEXT,
+            message_content TEXT,
+            sent_date TEXT,
+            response TEXT,
+            status TEXT,
+            FOREIGN KEY (prospect_id) REFERENCES prospects (id)
+        )
+    """)
+
+    # Create background generation job tables
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            campaign_id INTEGER,
+            status TEXT,
+            total INTEGER,
+            completed INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            max_concurrency INTEGER,
+            created_date TEXT,
+            updated_date TEXT,
+            FOREIGN KEY (campaign_id) REFERENCES campaigns (id)
+        )
+    """)
+
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS job_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER,
+            prospect_data TEXT,
+            prospect_id INTEGER,
+            status TEXT,
+            error TEXT,
+            FOREIGN KEY (job_id) REFERENCES jobs (id),
+            FOREIGN KEY (prospect_id) REFERENCES prospects (id)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_items_job_status ON job_items (job_id, status)")
+
+def _migration_2_prospect_profiles(c):
+    # Profile details needed to generate messages for imported prospects later
+    _add_missing_columns(c, 'prospects', {
+        'profile_summary': 'TEXT',
+        'recent_activity': 'TEXT'
+    })
+
+    # One row per LinkedIn profile per campaign; rows without a URL can't be deduped.
+    # Duplicates saved before the index existed are merged into the newest copy: it
+    # takes any fields it's missing from the older ones, and their messages and job
+    # items are moved over to it before they're deleted.
+    c.execute("""
+        CREATE TEMP TABLE prospect_duplicates AS
+        SELECT p.id AS duplicate_id, k.keep_id FROM prospects p JOIN (
+            SELECT campaign_id, profile_url, MAX(id) AS keep_id FROM prospects
+            WHERE profile_url <> '' GROUP BY campaign_id, profile_url HAVING COUNT(*) > 1
+        ) k ON p.campaign_id IS k.campaign_id AND p.profile_url = k.profile_url
+        WHERE p.id <> k.keep_id
+    """)
+    for column in ('name', 'title', 'company', 'industry', 'connection_message', 'follow_up_messages',
+                   'status'):
+        c.execute(f"""
+            UPDATE prospects SET {column} = (
+                SELECT p.{column} FROM prospect_duplicates d JOIN prospects p ON p.id = d.duplicate_id
+                WHERE d.keep_id = prospects.id AND p.{column} IS NOT NULL AND p.{column} <> ''
+                ORDER BY p.id DESC LIMIT 1
+            )
+            WHERE id IN (SELECT keep_id FROM prospect_duplicates) AND ({column} IS NULL OR {column} = '')
+        """)
+    c.execute("""
+        UPDATE prospects SET created_date = (
+            SELECT MIN(p.created_date) FROM prospect_duplicates d JOIN prospects p ON p.id = d.duplicate_id
+            WHERE d.keep_id = prospects.id
+        )
+        WHERE id IN (SELECT keep_id FROM prospect_duplicates) AND created_date > (
+            SELECT MIN(p.created_date) FROM prospect_duplicates d JOIN prospects p ON p.id = d.duplicate_id
+            WHERE d.keep_id = prospects.id
+        )
+    """)
+    for table in ('messages', 'job_items'):
+        c.execute(f"""
+            UPDATE {table} SET prospect_id = (
+                SELECT keep_id FROM prospect_duplicates WHERE duplicate_id = {table}.prospect_id
+            )
+            WHERE prospect_id IN (SELECT duplicate_id FROM prospect_duplicates)
+        """)
+    c.execute("DELETE FROM prospects WHERE id IN (SELECT duplicate_id FROM prospect_duplicates)")
+    if c.rowcount:
+        logger.warning("Merged %s duplicate prospects into the newest row for the same profile", c.rowcount)
+    c.execute("DROP TABLE prospect_duplicates")
+    c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_prospects_campaign_profile
+        ON prospects (campaign_id, profile_url) WHERE profile_url <> ''
+    """)
+
+def _migration_3_lookup_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prospects_campaign_status ON prospects (campaign_id, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prospects_status ON prospects (status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prospects_profile_url ON prospects (profile_url)")
+
+def _migration_4_follow_up_messages(c):
+    # Follow-ups move from the prospects.follow_up_messages JSON blob to messages rows
+    _add_missing_columns(c, 'messages', {
+        'sequence_number': 'INTEGER',
+        'scheduled_date': 'TEXT'
+    })
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_prospect ON messages (prospect_id, sequence_number)")
+
+    c.execute("""
+        SELECT id, follow_up_messages, created_date FROM prospects
+        WHERE follow_up_messages IS NOT NULL AND follow_up_messages <> ''
+    """)
+    rows, moved = [], []
+    for prospect_id, follow_ups, created_date in c.fetchall():
+        try:
+            follow_ups = json.loads(follow_ups)
+        except ValueError:
+            follow_ups = None
+        if not isinstance(follow_ups, list):
+            # Left in place rather than guessed at
+            logger.warning("Skipped moving follow-ups of prospect %s: follow_up_messages isn't a JSON list",
+                           prospect_id)
+            continue
+        moved.append((prospect_id,))
+        # A frozen copy of the cadence and insert logic as released, independent of
+        # follow_up_schedule() and _replace_follow_ups(), which have changed since
+        when = datetime.fromisoformat(created_date) if created_date else datetime.now()
+        for sequence_number, content in enumerate(follow_ups, 1):
+            when += timedelta(days=[3, 7, 14][min(sequence_number - 1, 2)])
+            rows.append((prospect_id, content, sequence_number, when.isoformat()))
+        c.execute("""
+            DELETE FROM messages WHERE prospect_id = ? AND message_type = 'follow_up' AND sent_date IS NULL
+        """, (prospect_id,))
+    c.executemany("""
+        INSERT INTO messages (prospect_id, message_type, message_content, sequence_number,
+                              scheduled_date, status)
+        VALUES (?, 'follow_up', ?, ?, ?, 'draft')
+    """, rows)
+    c.executemany("UPDATE prospects SET follow_up_messages = NULL WHERE id = ?", moved)
+
+def _migration_5_campaign_prospect_pages(c):
+    # (campaign_id, rowid) ordering for keyset pagination of a campaign's prospects
+    c.execute("CREATE INDEX IF NOT EXISTS idx_prospects_campaign ON prospects (campaign_id)")
+
+def _migration_6_campaign_daily_stats(c):
+    # Per campaign per day rollup kept current by triggers, so dashboards read a few
+    # hundred pre-aggregated rows instead of scanning prospects and messages
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS campaign_daily_stats (
+            campaign_id INTEGER,
+            day TEXT,
+            prospects_added INTEGER NOT NULL DEFAULT 0,
+            messages_generated INTEGER NOT NULL DEFAULT 0,
+            messages_sent INTEGER NOT NULL DEFAULT 0,
+            replies INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (campaign_id, day)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_campaign_daily_stats_day ON campaign_daily_stats (day)")
+
+    for name, event, column, day in ROLLUP_TRIGGERS:
+        campaign = 'NEW.campaign_id' if 'ON prospects' in event else \
+            '(SELECT campaign_id FROM prospects WHERE id = NEW.prospect_id)'
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                INSERT INTO campaign_daily_stats (campaign_id, day, {column})
+                SELECT {campaign}, {day}, 1 WHERE true
+                ON CONFLICT (campaign_id, day) DO UPDATE SET {column} = {column} + 1;
+            END
+        """)
+
+    rebuild_daily_stats(c)
+
+def _migration_7_campaign_token_usage(c):
+    # Model tokens spent per campaign per day, and an optional cap on the total
+    _add_missing_columns(c, 'campaigns', {'token_budget': 'INTEGER'})
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS campaign_token_usage (
+            campaign_id INTEGER,
+            day TEXT,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (campaign_id, day)
+        ) WITHOUT ROWID
+    """)
+
+def _migration_8_regeneration_jobs(c):
+    # Regeneration jobs must not be answered from the response cache
+    _add_missing_columns(c, 'jobs', {'bypass_cache': 'INTEGER NOT NULL DEFAULT 0'})
+
+def _migration_9_send_schedule(c):
+    # Follow-ups move from 'draft' to 'scheduled' once the previous message is sent;
+    # the partial index answers "what's due now" without scanning drafts or history
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (scheduled_date)
+        WHERE status = 'scheduled'
+    """)
+
+    # Messages sent per day and type, checked against the account's daily limits
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_send_counts (
+            day TEXT,
+            message_type TEXT,
+            sent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, message_type)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        INSERT OR REPLACE INTO daily_send_counts (day, message_type, sent)
+        SELECT date(sent_date), message_type, COUNT(*) FROM messages
+        WHERE sent_date IS NOT NULL GROUP BY date(sent_date), message_type
+    """)
+
+def _migration_10_data_versions(c):
+    # Per-table write counters behind data_version(), shared by every process
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+MIGRATIONS = [
+    _migration_1_base_schema,
+    _migration_2_prospect_profiles,
+    _migration_3_lookup_indexes,
+    _migration_4_follow_up_messages,
+    _migration_5_campaign_prospect_pages,
+    _migration_6_campaign_daily_stats,
+    _migration_7_campaign_token_usage,
+    _migration_8_regeneration_jobs,
+    _migration_9_send_schedule,
+    _migration_10_data_versions,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Initialize database
+def init_db():
+    """Bring the database schema up to SCHEMA_VERSION"""
+    version = get_connection().execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        # One transaction per migration so a failure leaves a consistent version
+        with transaction() as c:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+def ensure_db():
+    """Run init_db() once per database file per process rather than on every call"""
+    path = os.path.abspath(DB_PATH)
+    if path in _initialized:
+        return
+    with _initialized_lock:
+        if path not in _initialized:
+            init_db()
+            _initialized.add(path)
+
+def save_campaign(campaign_data):
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO campaigns (name, product_description, target_industry, target_roles,
+                                 company_size, region, outreach_goal, brand_voice, triggers, token_budget,
+                                 created_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            campaign_data['name'],
+            campaign_data['product_description'],
+            campaign_data['target_industry'],
+            campaign_data['target_roles'],
+            campaign_data['company_size'],
+            campaign_data['region'],
+            campaign_data['outreach_goal'],
+            campaign_data['brand_voice'],
+            campaign_data['triggers'],
+            campaign_data.get('token_budget') or None,
+            datetime.now().isoformat()
+        ))
+        campaign_id = c.lastrowid
+        bump_version(c, 'campaigns')
+    return campaign_id
+
+def set_campaign_token_budget(campaign_id, token_budget):
+    """Cap the campaign's total model tokens (None for no cap), resuming jobs stopped by the old cap"""
+    with transaction() as c:
+        c.execute("UPDATE campaigns SET token_budget = ? WHERE id = ?", (token_budget or None, campaign_id))
+        c.execute("""
+            UPDATE jobs SET status = 'pending', updated_date = ?
+            WHERE campaign_id = ? AND status = 'over_budget'
+        """, (datetime.now().isoformat(), campaign_id))
+        bump_version(c, 'campaigns', 'jobs')
+
+def record_token_usage(campaign_id, input_tokens, output_tokens):
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO campaign_token_usage (campaign_id, day, input_tokens, output_tokens, requests)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (campaign_id, day) DO UPDATE SET
+                input_tokens = input_tokens + excluded.input_tokens,
+                output_tokens = output_tokens + excluded.output_tokens,
+                requests = requests + 1
+        """, (campaign_id, datetime.now().date().isoformat(), input_tokens, output_tokens))
+        bump_version(c, 'token_usage')
+
+def load_token_usage(campaign_id=None):
+    """Total input/output tokens and requests per campaign"""
+    where, params = ("WHERE campaign_id = ?", (campaign_id,)) if campaign_id is not None else ("", ())
+    rows = query(f"""
+        SELECT campaign_id, SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+               SUM(requests) AS requests
+        FROM campaign_token_usage {where} GROUP BY campaign_id
+    """, params)
+    return {row.pop('campaign_id'): row for row in rows}
+
+def campaign_tokens_used(campaign_id):
+    usage = load_token_usage(campaign_id).get(campaign_id)
+    return usage['input_tokens'] + usage['output_tokens'] if usage else 0
+
+class CampaignRepository:
+    """Campaigns in newest-first order with an id index for constant-time lookups"""
+
+    __slots__ = ('ids', 'by_id')
+
+    def __init__(self, campaigns):
+        self.by_id = {campaign['id']: campaign for campaign in campaigns}
+        self.ids = list(self.by_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.by_id[campaign_id] for campaign_id in self.ids)
+
+    def get(self, campaign_id):
+        return self.by_id.get(campaign_id)
+
+    def name(self, campaign_id):
+        campaign = self.by_id.get(campaign_id)
+        return campaign['name'] if campaign else f"Campaign {campaign_id}"
+
+    def page(self, start, count):
+        return [self.by_id[campaign_id] for campaign_id in self.ids[start:start + count]]
+
+def load_campaign_repository():
+    return CampaignRepository(query('SELECT * FROM campaigns ORDER BY created_date DESC'))
+
+def load_campaign(campaign_id):
+    rows = query('SELECT * FROM campaigns WHERE id = ?', (campaign_id,))
+    return rows[0] if rows else None
+
+def load_campaign_stats():
+    """Prospect counts per campaign, broken down by status, from one grouped query"""
+    stats = {}
+    rows = query("SELECT campaign_id, status, COUNT(*) AS count FROM prospects GROUP BY campaign_id, status")
+    for row in rows:
+        campaign_id, status, count = row['campaign_id'], row['status'], row['count']
+        campaign_stats = stats.setdefault(campaign_id, {'total': 0})
+        campaign_stats[status or 'unknown'] = count
+        campaign_stats['total'] += count
+    return stats
+
+def load_connection_messages(campaign_id):
+    """Every generated connection message of the campaign, with what's needed to compare them"""
+    return query("""
+        SELECT id, name, company, connection_message, status FROM prospects
+        WHERE campaign_id = ? AND connection_message IS NOT NULL AND connection_message <> ''
+        ORDER BY id
+    """, (campaign_id,))
+
+def load_daily_stats(since_day=None, campaign_id=None):
+    """Rows of the per campaign per day rollup, optionally from since_day onwards"""
+    conditions, params = [], []
+    if since_day:
+        conditions.append("day >= ?")
+        params.append(since_day)
+    if campaign_id is not None:
+        conditions.append("campaign_id = ?")
+        params.append(campaign_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return read_dataframe(f"""
+        SELECT campaign_id, day, prospects_added, messages_generated, messages_sent, replies
+        FROM campaign_daily_stats {where} ORDER BY day
+    """, params)
+
+def load_daily_totals(since_day=None, until_day=None):
+    """Rollup totals between two days inclusive, and how many campaigns had activity"""
+    conditions, params = [], []
+    if since_day:
+        conditions.append("day >= ?")
+        params.append(since_day)
+    if until_day:
+        conditions.append("day <= ?")
+        params.append(until_day)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    totals = query(f"""
+        SELECT COALESCE(SUM(prospects_added), 0) AS prospects_added,
+               COALESCE(SUM(messages_generated), 0) AS messages_generated,
+               COALESCE(SUM(messages_sent), 0) AS messages_sent,
+               COALESCE(SUM(replies), 0) AS replies,
+               COUNT(DISTINCT campaign_id) AS active_campaigns
+        FROM campaign_daily_stats {where}
+    """, params)[0]
+    return {column: int(value) for column, value in totals.items()}
+
+def load_prospects_page(campaign_id, after_id=0, limit=PAGE_SIZE):
+    """One page of a campaign's prospects, continuing after the given prospect id"""
+    return read_dataframe("""
+        SELECT id, name, title, company, industry, status, created_date FROM prospects
+        WHERE campaign_id = ? AND id > ?
+        ORDER BY id LIMIT ?
+    """, (campaign_id, after_id, limit))
+
+def save_prospect(prospect_data, campaign_id):
+    with transaction() as c:
+        prospect_id = insert_prospect(c, prospect_data, campaign_id)
+        bump_version(c, 'prospects')
+    return prospect_id
+
+# Prospect statuses before the connection request goes out; re-saving a prospect
+# only replaces its message and status while it is still in one of these
+UNSENT_STATUSES = "('pending', 'queued', 'draft', 'failed')"
+
+# Insert a prospect, or update the existing row for the same profile in the campaign
+UPSERT_PROSPECT_SQL = f"""
+    INSERT INTO prospects (campaign_id, name, title, company, industry, profile_url,
+                         profile_summary, recent_activity, connection_message, status, created_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (campaign_id, profile_url) WHERE profile_url <> '' DO UPDATE SET
+        name = excluded.name,
+        title = excluded.title,
+        company = excluded.company,
+        industry = excluded.industry,
+        profile_summary = COALESCE(excluded.profile_summary, prospects.profile_summary),
+        recent_activity = COALESCE(excluded.recent_activity, prospects.recent_activity),
+        connection_message = CASE WHEN prospects.status IN {UNSENT_STATUSES}
+                                  THEN COALESCE(excluded.connection_message, prospects.connection_message)
+                                  ELSE prospects.connection_message END,
+        status = CASE WHEN excluded.connection_message IS NULL OR prospects.status NOT IN {UNSENT_STATUSES}
+                      THEN prospects.status ELSE excluded.status END
+"""
+
+def normalize_profile_url(url):
+    return (url or '').strip().rstrip('/')
+
+def _prospect_params(prospect_data, campaign_id, created_date):
+    connection_message = prospect_data.get('connection_message')
+    return (
+        campaign_id,
+        prospect_data['name'],
+        prospect_data['title'],
+        prospect_data['company'],
+        prospect_data['industry'],
+        normalize_profile_url(prospect_data.get('profile_url')),
+        prospect_data.get('profile_summary') or None,
+        prospect_data.get('recent_activity') or None,
+        connection_message,
+        # Imported prospects wait for generation until they have a message
+        'draft' if connection_message else 'pending',
+        created_date
+    )
+
+def insert_prospect(c, prospect_data, campaign_id, created_date=None):
+    created_date = created_date or datetime.now().isoformat()
+    params = _prospect_params(prospect_data, campaign_id, created_date)
+    c.execute(UPSERT_PROSPECT_SQL, params)
+
+    # lastrowid isn't reliable when the upsert took the UPDATE path
+    profile_url = params[5]
+    if profile_url:
+        # The profile_url <> '' term lets SQLite use the partial unique index
+        c.execute("SELECT id FROM prospects WHERE campaign_id = ? AND profile_url = ? AND profile_url <> ''",
+                  (campaign_id, profile_url))
+        prospect_id = c.fetchone()[0]
+    else:
+        prospect_id = c.lastrowid
+
+    if prospect_data.get('follow_up_messages') is not None:
+        _replace_follow_ups(c, prospect_id, prospect_data['follow_up_messages'], created_date)
+    return prospect_id
+
+def follow_up_schedule(base_date, count, first=0):
+    """Scheduled ISO dates for a sequence of follow-ups starting from base_date.
+
+    `first` is the number of follow-ups already sent, so the cadence resumes
+    with the next delay.
+    """
+    when = datetime.fromisoformat(base_date) if base_date else datetime.now()
+    dates = []
+    for i in range(first, first + count):
+        when += timedelta(days=FOLLOW_UP_DELAYS_DAYS[min(i, len(FOLLOW_UP_DELAYS_DAYS) - 1)])
+        dates.append(when.isoformat())
+    return dates
+
+def _replace_follow_ups(c, prospect_id, follow_ups, base_date):
+    # Regenerating replaces draft follow-ups; scheduled and sent ones are kept
+    c.execute("""
+        DELETE FROM messages WHERE prospect_id = ? AND message_type = 'follow_up' AND status = 'draft'
+    """, (prospect_id,))
+    c.execute("SELECT sequence_number FROM messages WHERE prospect_id = ? AND message_type = 'follow_up'",
+              (prospect_id,))
+    kept = {row[0] for row in c.fetchall()}
+    c.executemany("""
+        INSERT INTO messages (prospect_id, message_type, message_content, sequence_number,
+                              scheduled_date, status)
+        VALUES (?, 'follow_up', ?, ?, ?, 'draft')
+    """, [
+        (prospect_id, content, sequence_number, scheduled_date)
+        for sequence_number, (content, scheduled_date)
+        in enumerate(zip(follow_ups, follow_up_schedule(base_date, len(follow_ups))), 1)
+        if sequence_number not in kept
+    ])
+
+def _schedule_follow_ups(c, prospect_id, sent_sequence, sent_date):
+    # Unsent follow-ups are re-dated from the message just sent; only the next one comes due
+    c.execute("""
+        SELECT id FROM messages
+        WHERE prospect_id = ? AND message_type = 'follow_up' AND sequence_number > ? AND sent_date IS NULL
+        ORDER BY sequence_number
+    """, (prospect_id, sent_sequence))
+    message_ids = [row[0] for row in c.fetchall()]
+    c.executemany("UPDATE messages SET scheduled_date = ?, status = ? WHERE id = ?", [
+        (scheduled_date, 'scheduled' if i == 0 else 'draft', message_id)
+        for i, (message_id, scheduled_date)
+        in enumerate(zip(message_ids, follow_up_schedule(sent_date, len(message_ids), first=sent_sequence)))
+    ])
+
+def load_due_connections(limit):
+    """Generated connection requests not sent yet, oldest first"""
+    return query("""
+        SELECT id AS prospect_id, campaign_id, name, company, profile_url, connection_message
+        FROM prospects WHERE status = 'draft' ORDER BY id LIMIT ?
+    """, (limit,))
+
+def load_due_follow_ups(now, limit):
+    """Follow-ups whose scheduled date has passed, most overdue first"""
+    return query("""
+        SELECT m.id, m.prospect_id, p.campaign_id, p.name, p.company, p.profile_url,
+               m.sequence_number, m.message_content, m.scheduled_date
+        FROM messages m JOIN prospects p ON p.id = m.prospect_id
+        WHERE m.status = 'scheduled' AND m.scheduled_date <= ?
+        ORDER BY m.scheduled_date LIMIT ?
+    """, (now, limit))
+
+def load_send_counts(day):
+    """Messages sent on the given day, per message type"""
+    rows = query("SELECT message_type, sent FROM daily_send_counts WHERE day = ?", (day,))
+    return {row['message_type']: row['sent'] for row in rows}
+
+def mark_sent(message_type, item_id, daily_limit, sent_date=None):
+    """Record a connection request (by prospect id) or follow-up (by message id) as sent.
+
+    The daily count is checked and incremented in the same transaction, so
+    concurrent senders can't exceed daily_limit. Returns 'sent', 'limit' when
+    today's limit is used up, or 'not_due' if the message isn't in the queue.
+    """
+    sent_date = sent_date or datetime.now().isoformat()
+    day = sent_date[:10]
+    with transaction() as c:
+        c.execute("SELECT sent FROM daily_send_counts WHERE day = ? AND message_type = ?",
+                  (day, message_type))
+        row = c.fetchone()
+        if row and row[0] >= daily_limit:
+            return 'limit'
+
+        if message_type == 'connection':
+            c.execute("UPDATE prospects SET status = 'sent' WHERE id = ? AND status = 'draft'", (item_id,))
+            if c.rowcount == 0:
+                return 'not_due'
+            prospect_id, sequence_number = item_id, 0
+            c.execute("""
+                INSERT INTO messages (prospect_id, message_type, message_content, sequence_number,
+                                      sent_date, status)
+                SELECT id, 'connection', connection_message, 0, ?, 'sent' FROM prospects WHERE id = ?
+            """, (sent_date, prospect_id))
+        else:
+            c.execute("""
+                UPDATE messages SET sent_date = ?, status = 'sent'
+                WHERE id = ? AND message_type = 'follow_up' AND status = 'scheduled' AND scheduled_date <= ?
+            """, (sent_date, item_id, sent_date))
+            if c.rowcount == 0:
+                return 'not_due'
+            c.execute("SELECT prospect_id, sequence_number FROM messages WHERE id = ?", (item_id,))
+            prospect_id, sequence_number = c.fetchone()
+
+        _schedule_follow_ups(c, prospect_id, sequence_number, sent_date)
+        c.execute("""
+            INSERT INTO daily_send_counts (day, message_type, sent) VALUES (?, ?, 1)
+            ON CONFLICT (day, message_type) DO UPDATE SET sent = sent + 1
+        """, (day, message_type))
+        bump_version(c, 'prospects', 'messages', 'send_counts')
+    return 'sent'
+
+def load_follow_ups(prospect_id):
+    rows = query("""
+        SELECT message_content FROM messages
+        WHERE prospect_id = ? AND message_type = 'follow_up'
+        ORDER BY sequence_number
+    """, (prospect_id,))
+    return [row['message_content'] for row in rows]
+
+def save_prospects_bulk(rows, campaign_id, chunk_size=BULK_CHUNK_SIZE, progress_callback=None):
+    """Upsert many prospects, committing once per chunk; returns the number of rows written"""
+    written = 0
+    created_date = datetime.now().isoformat()
+    chunk = []
+
+    def flush():
+        nonlocal written, chunk
+        with transaction() as c:
+            c.executemany(UPSERT_PROSPECT_SQL, [
+                _prospect_params(prospect_data, campaign_id, created_date)
+                for prospect_data in chunk if prospect_data.get('follow_up_messages') is None
+            ])
+            # Rows that carry follow-ups need their prospect id for the messages rows
+            for prospect_data in chunk:
+                if prospect_data.get('follow_up_messages') is not None:
+                    insert_prospect(c, prospect_data, campaign_id, created_date)
+            bump_version(c, 'prospects')
+        written += len(chunk)
+        chunk = []
+        if progress_callback:
+            progress_callback(written)
+
+    for prospect_data in rows:
+        chunk.append(prospect_data)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    return written
+
+def create_job(campaign_id, prospects_data, max_concurrency):
+    now = datetime.now().isoformat()
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO jobs (campaign_id, status, total, max_concurrency, created_date, updated_date)
+            VALUES (?, 'pending', ?, ?, ?, ?)
+        """, (campaign_id, len(prospects_data), max_concurrency, now, now))
+        job_id = c.lastrowid
+
+        c.executemany("""
+            INSERT INTO job_items (job_id, prospect_data, status) VALUES (?, ?, 'pending')
+        """, [(job_id, json.dumps(prospect_data)) for prospect_data in prospects_data])
+        bump_version(c, 'jobs')
+    return job_id
+
+def queue_pending_prospects(campaign_id, max_concurrency):
+    """Create a job for every prospect in the campaign still waiting for messages"""
+    now = datetime.now().isoformat()
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO jobs (campaign_id, status, total, max_concurrency, created_date, updated_date)
+            VALUES (?, 'pending', 0, ?, ?, ?)
+        """, (campaign_id, max_concurrency, now, now))
+        job_id = c.lastrowid
+
+        c.execute("""
+            INSERT INTO job_items (job_id, prospect_id, status)
+            SELECT ?, id, 'pending' FROM prospects WHERE campaign_id = ? AND status = 'pending'
+            ORDER BY id
+        """, (job_id, campaign_id))
+        total = c.rowcount
+
+        if total == 0:
+            c.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return None
+
+        c.execute("UPDATE prospects SET status = 'queued' WHERE campaign_id = ? AND status = 'pending'",
+                  (campaign_id,))
+        c.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+        bump_version(c, 'prospects', 'jobs')
+    return job_id
+
+def queue_regeneration(campaign_id, prospect_ids, max_concurrency):
+    """Create a job regenerating the given unsent prospects' messages, bypassing the response cache"""
+    now = datetime.now().isoformat()
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO jobs (campaign_id, status, total, max_concurrency, bypass_cache, created_date, updated_date)
+            VALUES (?, 'pending', 0, ?, 1, ?, ?)
+        """, (campaign_id, max_concurrency, now, now))
+        job_id = c.lastrowid
+
+        c.executemany("""
+            INSERT INTO job_items (job_id, prospect_id, status)
+            SELECT ?, id, 'pending' FROM prospects WHERE id = ? AND campaign_id = ? AND status = 'draft'
+        """, [(job_id, prospect_id, campaign_id) for prospect_id in prospect_ids])
+        c.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ?", (job_id,))
+        total = c.fetchone()[0]
+
+        if total == 0:
+            c.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return None
+
+        c.execute("""
+            UPDATE prospects SET status = 'queued'
+            WHERE id IN (SELECT prospect_id FROM job_items WHERE job_id = ?)
+        """, (job_id,))
+        c.execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+        bump_version(c, 'prospects', 'jobs')
+    return job_id
+
+def load_jobs():
+    return read_dataframe("""
+        SELECT jobs.id, campaigns.name AS campaign, jobs.status, jobs.total, jobs.completed,
+               jobs.failed, jobs.created_date, jobs.updated_date
+        FROM jobs LEFT JOIN campaigns ON campaigns.id = jobs.campaign_id
+        ORDER BY jobs.id DESC
+    """)
+
+def claim_next_job(job_id=None):
+    """Mark the oldest runnable job, or job_id if it is runnable, as running and return it.
+
+    Running jobs whose heartbeat is older than JOB_STALE_SECONDS belonged to a
+    worker that died, so they are picked up again.
+    """
+    stale_before = (datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+    runnable = "(status = 'pending' OR (status = 'running' AND updated_date < ?))"
+    params = (stale_before,)
+    if job_id is not None:
+        runnable += " AND id = ?"
+        params += (job_id,)
+
+    with transaction() as c:
+        c.execute(f"SELECT * FROM jobs WHERE {runnable} ORDER BY id LIMIT 1", params)
+        row = c.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([column[0] for column in c.description], row))
+
+        c.execute("UPDATE jobs SET status = 'running', updated_date = ? WHERE id = ?",
+                  (datetime.now().isoformat(), job['id']))
+        bump_version(c, 'jobs')
+    return job
+
+def load_job(job_id):
+    rows = query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return rows[0] if rows else None
+
+def load_pending_job_items(job_id, limit=JOB_CHUNK_SIZE):
+    """Return (item_id, prospect_data) pairs; queued prospects are read from their row"""
+    rows = query("""
+        SELECT job_items.id AS item_id, job_items.prospect_data, job_items.prospect_id,
+               p.name, p.title, p.company, p.industry, p.profile_url,
+               p.profile_summary, p.recent_activity
+        FROM job_items LEFT JOIN prospects p ON p.id = job_items.prospect_id
+        WHERE job_items.job_id = ? AND job_items.status = 'pending'
+        ORDER BY job_items.id LIMIT ?
+    """, (job_id, limit))
+
+    items = []
+    for row in rows:
+        item_id = row.pop('item_id')
+        prospect_data = row.pop('prospect_data')
+        items.append((item_id, json.loads(prospect_data) if prospect_data else row))
+    return items
+
+def complete_job_item(job_id, item_id, prospect_data, campaign_id):
+    # Save the prospect and tick off the item atomically so a crash can't duplicate it
+    with transaction() as c:
+        prospect_id = prospect_data.get('prospect_id')
+        if prospect_id:
+            c.execute("UPDATE prospects SET connection_message = ?, status = 'draft' WHERE id = ?",
+                      (prospect_data['connection_message'], prospect_id))
+            _replace_follow_ups(c, prospect_id, prospect_data['follow_up_messages'],
+                                datetime.now().isoformat())
+        else:
+            prospect_id = insert_prospect(c, prospect_data, campaign_id)
+        c.execute("UPDATE job_items SET status = 'done', prospect_id = ? WHERE id = ?",
+                  (prospect_id, item_id))
+        c.execute("UPDATE jobs SET completed = completed + 1, updated_date = ? WHERE id = ?",
+                  (datetime.now().isoformat(), job_id))
+        bump_version(c, 'prospects', 'jobs')
+
+def fail_job_item(job_id, item_id, error):
+    with transaction() as c:
+        c.execute("UPDATE job_items SET status = 'failed', error = ? WHERE id = ?", (error, item_id))
+        c.execute("""
+            UPDATE prospects SET status = 'failed'
+            WHERE id = (SELECT prospect_id FROM job_items WHERE id = ?)
+        """, (item_id,))
+        c.execute("UPDATE jobs SET failed = failed + 1, updated_date = ? WHERE id = ?",
+                  (datetime.now().isoformat(), job_id))
+        bump_version(c, 'prospects', 'jobs')
+
+def set_job_status(job_id, status):
+    with transaction() as c:
+        c.execute("UPDATE jobs SET status = ?, updated_date = ? WHERE id = ?",
+                  (status, datetime.now().isoformat(), job_id))
+        bump_version(c, 'jobs')
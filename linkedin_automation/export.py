@@ -0,0 +1,117 @@
+"""
+Per-campaign export of prospects and their messages
+
+Rows are read straight from the prospects/messages tables through one cursor
+and written out EXPORT_CHUNK_SIZE at a time, to CSV or (with pyarrow) Parquet,
+so exporting a 100k-prospect campaign keeps only one chunk in memory.
+"""
+
+import csv
+import io
+from typing import IO, Iterator, List, Optional, Sequence, Union
+
+from .database import FOLLOW_UP_DELAYS_DAYS, get_connection
+from .metrics import metrics
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ['csv', 'parquet']
+
+def _follow_up(sequence_number: int, column: str) -> str:
+    # Served by idx_messages_prospect (prospect_id, sequence_number)
+    return f"""(SELECT {column} FROM messages WHERE prospect_id = p.id
+                AND message_type = 'follow_up' AND sequence_number = {sequence_number})"""
+
+# Exportable columns and the SQL producing each, in file order
+EXPORT_COLUMNS = {
+    'id': 'p.id',
+    'name': 'p.name',
+    'title': 'p.title',
+    'company': 'p.company',
+    'industry': 'p.industry',
+    'profile_url': 'p.profile_url',
+    'status': 'p.status',
+    'created_date': 'p.created_date',
+    'connection_message': 'p.connection_message',
+}
+for _number in range(1, len(FOLLOW_UP_DELAYS_DAYS) + 1):
+    EXPORT_COLUMNS[f'follow_up_{_number}'] = _follow_up(_number, 'message_content')
+    EXPORT_COLUMNS[f'follow_up_{_number}_scheduled'] = _follow_up(_number, 'scheduled_date')
+    EXPORT_COLUMNS[f'follow_up_{_number}_sent'] = _follow_up(_number, 'sent_date')
+
+DEFAULT_EXPORT_COLUMNS = ['name', 'title', 'company', 'profile_url', 'status', 'connection_message',
+                          'follow_up_1', 'follow_up_2', 'follow_up_3']
+
+def _check_columns(columns: Optional[Sequence[str]]) -> List[str]:
+    columns = list(columns or DEFAULT_EXPORT_COLUMNS)
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    return columns
+
+def iter_campaign_rows(campaign_id: int, columns: Optional[Sequence[str]] = None,
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """Yield the campaign's prospects, in id order, as lists of up to chunk_size row tuples"""
+    columns = _check_columns(columns)
+    select = ", ".join(f"{EXPORT_COLUMNS[column]} AS {column}" for column in columns)
+    cursor = get_connection().execute(f"""
+        SELECT {select} FROM prospects p WHERE p.campaign_id = ? ORDER BY p.id
+    """, (campaign_id,))
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+def write_csv(campaign_id: int, file: IO[str], columns: Optional[Sequence[str]] = None,
+              chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Write the campaign to a text file as CSV with a header row; returns the number of rows"""
+    columns = _check_columns(columns)
+    writer = csv.writer(file)
+    writer.writerow(columns)
+    written = 0
+    with metrics.timer('export_seconds', format='csv'):
+        for rows in iter_campaign_rows(campaign_id, columns, chunk_size):
+            writer.writerows(rows)
+            written += len(rows)
+    return written
+
+def write_parquet(campaign_id: int, file: Union[str, IO[bytes]], columns: Optional[Sequence[str]] = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Write the campaign to a path or binary file as Parquet, one row group per chunk"""
+    # Optional dependency, only needed for Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _check_columns(columns)
+    schema = pa.schema([(column, pa.int64() if column == 'id' else pa.string()) for column in columns])
+    written = 0
+    with metrics.timer('export_seconds', format='parquet'), pq.ParquetWriter(file, schema) as writer:
+        for rows in iter_campaign_rows(campaign_id, columns, chunk_size):
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema))
+            written += len(rows)
+        if written == 0:
+            writer.write_table(schema.empty_table())
+    return written
+
+def export_campaign(campaign_id: int, file: Union[str, IO[bytes]], fmt: str = 'csv',
+                    columns: Optional[Sequence[str]] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Export the campaign to a path or binary file in the given format; returns the number of rows"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'parquet':
+        return write_parquet(campaign_id, file, columns, chunk_size)
+
+    if isinstance(file, str):
+        with open(file, 'w', newline='', encoding='utf-8') as text:
+            return write_csv(campaign_id, text, columns, chunk_size)
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    try:
+        return write_csv(campaign_id, text, columns, chunk_size)
+    finally:
+        # Hand the binary file back to the caller open
+        text.detach()
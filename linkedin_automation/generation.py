@@ -0,0 +1,1362 @@
+"""
+Message generation core for LinkedIn Sales Automation Tool
+
+Prompt building and parsing, the rate-limited and retrying Gemini client, the
+response cache, and the background job worker. Nothing here depends on
+Streamlit, so the CLI and worker processes can import it directly.
+"""
+
+import json
+import os
+import time
+import re
+import hashlib
+import random
+import threading
+import queue
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Optional, Callable, Iterator, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from . import config
+from .config import CACHE_DB_PATH
+from .database import (
+    get_connection, transaction, load_campaign, claim_next_job, load_pending_job_items,
+    complete_job_item, fail_job_item, set_job_status, campaign_tokens_used, record_token_usage
+)
+from .metrics import metrics
+from .model_backends import make_backend
+
+# Number of prospects generated in parallel by bulk runs
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Retries and circuit breaking; the request rate is config.REQUESTS_PER_MINUTE
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60.0
+
+# Batched generation: gemini-1.5-flash limits (tokens) and per-prospect output estimate
+MODEL_INPUT_TOKEN_LIMIT = 1_000_000
+MODEL_OUTPUT_TOKEN_LIMIT = 8192
+BATCH_OUTPUT_TOKENS_PER_PROSPECT = 150
+DEFAULT_BATCH_SIZE = 20
+
+# Model routing: latency/outcome samples kept per model, the samples needed before its
+# percentile replaces the initial hedge delay, and the recent error rate at which
+# the fallback is preferred over the primary
+ROUTING_WINDOW = 200
+ROUTING_MIN_SAMPLES = 20
+HEDGE_INITIAL_DELAY = 5.0
+HEDGE_MIN_DELAY = 0.05
+ROUTE_ERROR_RATE = 0.25
+ROUTER_MAX_WORKERS = 64
+
+# Campaign prefixes kept as model variants (system instruction / cached content) per client
+PREFIXED_MODELS = 32
+
+# Response cache settings (stored next to linkedin_automation.db)
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+CACHE_MAX_ENTRIES = 5000
+
+class ResponseCache:
+    """SQLite-backed cache of model responses keyed by a hash of the request"""
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready_path = None
+
+    def _init_db(self):
+        # Created on first use (per resolved file, as the default path is relative to the
+        # working directory), so importing the package never writes to the working directory
+        path = os.path.abspath(self.db_path)
+        if path == self._ready_path:
+            return
+        with transaction(self.db_path) as c:
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    created_at REAL,
+                    last_accessed REAL
+                )
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)")
+        self._ready_path = path
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, generation_config: Optional[Dict] = None,
+                 system_instruction: Optional[str] = None) -> str:
+        request = [model_name, prompt, generation_config or {}]
+        if system_instruction:
+            request.append(system_instruction)
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        self._init_db()
+        now = time.time()
+        row = get_connection(self.db_path).execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row and now - row[1] <= self.ttl_seconds:
+            with transaction(self.db_path) as c:
+                c.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+            with self._lock:
+                self.hits += 1
+            return row[0]
+
+        if row:
+            # Expired entry
+            with transaction(self.db_path) as c:
+                c.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str):
+        self._init_db()
+        now = time.time()
+        with transaction(self.db_path) as c:
+            c.execute("""
+                INSERT OR REPLACE INTO responses (key, response, created_at, last_accessed)
+                VALUES (?, ?, ?, ?)
+            """, (key, response, now, now))
+
+            # Drop expired entries, then the least recently used ones over the cap
+            c.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            count = c.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                c.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY last_accessed ASC LIMIT ?
+                    )
+                """, (count - self.max_entries,))
+
+    def delete(self, key: str):
+        self._init_db()
+        with transaction(self.db_path) as c:
+            c.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        self._init_db()
+        with transaction(self.db_path) as c:
+            c.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        self._init_db()
+        entries = get_connection(self.db_path).execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+response_cache = ResponseCache()
+
+class GenerationError(Exception):
+    """Raised when the model could not produce a message"""
+
+class RateLimitError(GenerationError):
+    """Quota was still exhausted after all retries"""
+
+class ModelUnavailableError(GenerationError):
+    """Transient API failures persisted after all retries"""
+
+class BudgetExceededError(GenerationError):
+    """Raised instead of calling the model once a campaign has spent its token budget"""
+
+class CircuitOpenError(GenerationError):
+    """Calls are short-circuited because the API is failing"""
+
+class RequestCancelledError(GenerationError):
+    """The request was abandoned, e.g. because a hedged copy answered first"""
+
+class ConfigurationError(GenerationError):
+    """The model backend can't be created, e.g. GEMINI_API_KEY is not set"""
+
+# HTTP status codes worth retrying (google.api_core exceptions expose .code)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+
+def is_rate_limit(error: Exception) -> bool:
+    return getattr(error, 'code', None) == 429
+
+class TokenBucket:
+    """Thread-safe token bucket that slows down when the API reports 429s"""
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 8
+        self.rate = self.max_rate
+        self.capacity = capacity if capacity is not None else max(1.0, requests_per_minute / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cancel: Optional[threading.Event] = None) -> bool:
+        """Wait for a token; returns False without one if cancel is set first"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_time = (1 - self.tokens) / self.rate
+            if cancel is None:
+                time.sleep(wait_time)
+            elif cancel.wait(wait_time):
+                return False
+
+    def throttle(self):
+        # Multiplicative decrease on quota errors...
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        # ...and additive increase back towards the configured tier on success
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class CircuitBreaker:
+    """Stops calling the API after repeated failures until a cool-down passes"""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single trial request through
+                self.state = 'half_open'
+                return
+            raise CircuitOpenError("Gemini API is unavailable; calls are paused until it recovers")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = 'closed'
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+class GeminiClient:
+    """Wraps model.generate_content with rate limiting, retries and a circuit breaker"""
+
+    def __init__(self, model, requests_per_minute: Optional[float] = None,
+                 max_retries: int = MAX_RETRIES, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY, breaker: Optional[CircuitBreaker] = None):
+        self.model = model
+        if requests_per_minute is None:
+            requests_per_minute = config.REQUESTS_PER_MINUTE
+        self.limiter = TokenBucket(requests_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.sleep = time.sleep
+        # Model variants carrying a campaign prefix as their system instruction
+        self._prefixed_models: Dict[str, object] = {}
+        self._prefixed_models_lock = threading.Lock()
+        self._system_instructions_supported = True
+
+    @property
+    def model_name(self) -> str:
+        return self.model.model_name
+
+    def _handle_failure(self, error: Exception, attempt: int):
+        """Raise the typed error for a failed attempt, or back off before the next one"""
+        metrics.inc('model_errors_total', model=self.model_name, code=getattr(error, 'code', 'none'))
+        if not is_retryable(error):
+            # The API answered, so it is reachable: this also ends a half-open trial
+            self.breaker.record_success()
+            raise GenerationError(f"Gemini request failed: {error}") from error
+
+        self.breaker.record_failure()
+        if is_rate_limit(error):
+            self.limiter.throttle()
+        if attempt == self.max_retries:
+            error_type = RateLimitError if is_rate_limit(error) else ModelUnavailableError
+            raise error_type(f"Gemini request failed after {attempt + 1} attempts: {error}") from error
+
+        # Exponential backoff with full jitter
+        metrics.inc('model_retries_total', model=self.model_name)
+        self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def _resolve(self, prompt: str, system_instruction: Optional[str]):
+        """The model to call and the prompt to send it.
+
+        Backends with with_system_instruction() get one model per prefix, so the
+        prefix travels as a system instruction (or cached content) instead of
+        being repeated in every prompt; others get it prepended to the prompt,
+        as do backends whose SDK turns out not to support system instructions.
+        Variants with an expires_at (cached content) are rebuilt once it passes.
+        """
+        if not system_instruction:
+            return self.model, prompt
+        with_system_instruction = getattr(self.model, 'with_system_instruction', None)
+        if with_system_instruction is None or not self._system_instructions_supported:
+            return self.model, f"{system_instruction}\n\n{prompt}"
+
+        with self._prefixed_models_lock:
+            model = self._prefixed_models.get(system_instruction)
+            expires_at = getattr(model, 'expires_at', None)
+            if model is None or (expires_at is not None and time.monotonic() >= expires_at):
+                self._prefixed_models.pop(system_instruction, None)
+                if len(self._prefixed_models) >= PREFIXED_MODELS:
+                    # Drop the oldest campaign's variant
+                    self._prefixed_models.pop(next(iter(self._prefixed_models)))
+                try:
+                    model = with_system_instruction(system_instruction)
+                except (TypeError, AttributeError):
+                    # SDK too old for system_instruction / context caching
+                    self._system_instructions_supported = False
+                    return self.model, f"{system_instruction}\n\n{prompt}"
+                self._prefixed_models[system_instruction] = model
+        return model, prompt
+
+    def _before_attempt(self, cancel: Optional[threading.Event] = None):
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelledError("Request cancelled")
+        with metrics.timer('model_rate_limit_wait_seconds', model=self.model_name):
+            acquired = self.limiter.acquire(cancel)
+        if not acquired:
+            raise RequestCancelledError("Request cancelled while waiting for the rate limiter")
+        # Only after the wait: a half-open trial claimed here always goes out and records its outcome
+        self.breaker.before_call()
+
+    def _record_success(self, mode: str, started: float, prompt: str, text: str, usage=None,
+                        on_usage: Optional[Callable[[int, int], None]] = None,
+                        on_latency: Optional[Callable[[float], None]] = None):
+        self.breaker.record_success()
+        self.limiter.recover()
+        # Only the answered attempt, without rate limiter waits or retry backoff
+        latency = time.perf_counter() - started
+        metrics.observe('model_request_seconds', latency, model=self.model_name, mode=mode, outcome='ok')
+        if on_latency:
+            on_latency(latency)
+        # Prefer the API's own token counts; fall back to the same estimate batching uses
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        response_tokens = getattr(usage, 'candidates_token_count', None) or estimate_tokens(text)
+        metrics.inc('model_prompt_tokens_total', prompt_tokens, model=self.model_name)
+        metrics.inc('model_response_tokens_total', response_tokens, model=self.model_name)
+        if on_usage:
+            on_usage(prompt_tokens, response_tokens)
+
+    def generate_text(self, prompt: str, generation_config: Optional[Dict] = None,
+                      system_instruction: Optional[str] = None,
+                      on_usage: Optional[Callable[[int, int], None]] = None,
+                      cancel: Optional[threading.Event] = None,
+                      on_latency: Optional[Callable[[float], None]] = None) -> str:
+        """Generate a reply; on_usage is called with (prompt_tokens, response_tokens) once it is paid for.
+
+        Setting cancel stops the request at its next rate limiter wait or retry,
+        raising RequestCancelledError; a call already sent runs to completion.
+        on_latency is called with the seconds the answered API call took.
+        """
+        kwargs = {'generation_config': generation_config} if generation_config else {}
+        model, prompt = self._resolve(prompt, system_instruction)
+        # Token estimates must count the prefix even when it travels separately
+        billed_prompt = prompt if model is self.model else f"{system_instruction}\n\n{prompt}"
+
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt(cancel)
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                metrics.observe('model_request_seconds', time.perf_counter() - started,
+                                model=self.model_name, mode='sync', outcome='error')
+                self._handle_failure(e, attempt)
+                continue
+
+            try:
+                text = response.text.strip()
+            except ValueError as e:
+                # Raised by the SDK when the candidate was blocked or empty
+                self._record_success('sync', started, billed_prompt, '', on_usage=on_usage)
+                raise GenerationError(f"Gemini returned no text: {e}") from e
+            self._record_success('sync', started, billed_prompt, text, getattr(response, 'usage_metadata', None),
+                                 on_usage, on_latency)
+            return text
+
+    def stream_text(self, prompt: str, generation_config: Optional[Dict] = None,
+                    system_instruction: Optional[str] = None,
+                    on_usage: Optional[Callable[[int, int], None]] = None,
+                    on_latency: Optional[Callable[[float], None]] = None) -> Iterator[str]:
+        """Yield the response text as it arrives.
+
+        Failures are retried like generate_text until the first chunk has been
+        yielded; after that the partial text can't be taken back, so they raise.
+        """
+        kwargs = {'generation_config': generation_config} if generation_config else {}
+        model, prompt = self._resolve(prompt, system_instruction)
+        billed_prompt = prompt if model is self.model else f"{system_instruction}\n\n{prompt}"
+
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt()
+            started = time.perf_counter()
+            chunks = []
+            usage = None
+            try:
+                for chunk in model.generate_content(prompt, stream=True, **kwargs):
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without parts, e.g. the final one carrying the finish reason
+                        continue
+                    if text:
+                        if not chunks:
+                            metrics.observe('model_first_chunk_seconds', time.perf_counter() - started,
+                                            model=self.model_name)
+                        chunks.append(text)
+                        yield text
+            except GeneratorExit:
+                # The caller stopped reading; the API was answering
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                metrics.observe('model_request_seconds', time.perf_counter() - started,
+                                model=self.model_name, mode='stream', outcome='error')
+                if chunks:
+                    self.breaker.record_failure()
+                    raise GenerationError(f"Gemini stream interrupted: {e}") from e
+                self._handle_failure(e, attempt)
+                continue
+
+            self._record_success('stream', started, billed_prompt, ''.join(chunks), usage, on_usage, on_latency)
+            if not chunks:
+                raise GenerationError("Gemini returned no text")
+            return
+
+class ModelStats:
+    """Recent latencies and outcomes of one model's requests"""
+
+    def __init__(self, window: int = ROUTING_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, seconds: Optional[float] = None):
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile of recent successes, or None until there are enough of them"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < ROUTING_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            outcomes = list(self.outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+# Raised without the model answering badly, so they don't count against its error rate
+NOT_MODEL_FAILURES = (RequestCancelledError, CircuitOpenError, BudgetExceededError)
+
+class ModelRouter:
+    """Sends each request to a primary model, with a fallback for failures and slow replies.
+
+    A request goes to the preferred model: the primary, unless its circuit is
+    open or half-open or it has been failing more than the fallback. If no reply arrives
+    within that model's recent p95 latency (the hedge delay), the same request
+    is sent to the other model as well; the first good reply wins and the
+    other request is cancelled. A failed request is retried on the other model
+    straight away. Has the same generate_text/stream_text interface as
+    GeminiClient, so MessageGenerator can use either.
+    """
+
+    def __init__(self, primary: GeminiClient, fallback: GeminiClient,
+                 hedge_percentile: float = config.HEDGE_PERCENTILE,
+                 initial_hedge_delay: float = HEDGE_INITIAL_DELAY, min_hedge_delay: float = HEDGE_MIN_DELAY,
+                 max_workers: int = ROUTER_MAX_WORKERS):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.stats = {client.model_name: ModelStats() for client in (primary, fallback)}
+        # Both copies of a hedged request run here while the caller waits for the first reply
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-router')
+
+    # Requests are cached and reported under the primary model
+    @property
+    def model(self):
+        return self.primary.model
+
+    @property
+    def model_name(self) -> str:
+        return self.primary.model_name
+
+    def route(self) -> Tuple[GeminiClient, GeminiClient]:
+        """The model to try first and the one to hedge or fall back to"""
+        # A half-open primary is still on trial: keep it second until the trial closes it
+        if self.primary.breaker.state != 'closed' and self.fallback.breaker.state == 'closed':
+            return self.fallback, self.primary
+        primary_errors = self.stats[self.primary.model_name].error_rate()
+        if (primary_errors >= ROUTE_ERROR_RATE
+                and self.stats[self.fallback.model_name].error_rate() < primary_errors):
+            return self.fallback, self.primary
+        return self.primary, self.fallback
+
+    def hedge_delay(self, client: GeminiClient) -> float:
+        """Seconds to wait on client before sending the request to the other model too"""
+        latency = self.stats[client.model_name].percentile(self.hedge_percentile)
+        return self.initial_hedge_delay if latency is None else max(self.min_hedge_delay, latency)
+
+    def _call(self, client: GeminiClient, cancel: threading.Event, *args) -> str:
+        # The model's own latency, so rate limiter queueing doesn't set the hedge delay
+        latencies = []
+        try:
+            text = client.generate_text(*args, cancel=cancel, on_latency=latencies.append)
+        except NOT_MODEL_FAILURES:
+            raise
+        except GenerationError:
+            self.stats[client.model_name].record(False)
+            raise
+        self.stats[client.model_name].record(True, latencies[-1])
+        return text
+
+    def generate_text(self, prompt: str, generation_config: Optional[Dict] = None,
+                      system_instruction: Optional[str] = None,
+                      on_usage: Optional[Callable[[int, int], None]] = None) -> str:
+        """Generate a reply from whichever model answers first.
+
+        Both requests book their tokens through on_usage, as a losing request
+        that was already sent is still paid for.
+        """
+        first, second = self.route()
+        in_flight = {}
+
+        def send(client: GeminiClient):
+            cancel = threading.Event()
+            future = self._executor.submit(self._call, client, cancel, prompt, generation_config,
+                                           system_instruction, on_usage)
+            in_flight[future] = (client, cancel)
+
+        send(first)
+        timeout = self.hedge_delay(first)
+        errors = []
+        while in_flight:
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            timeout = None
+            if not done:
+                metrics.inc('model_hedges_total', model=second.model_name)
+                send(second)
+                continue
+
+            for future in done:
+                client, _ = in_flight.pop(future)
+                try:
+                    text = future.result()
+                except GenerationError as e:
+                    errors.append(e)
+                    if not in_flight and len(errors) == 1:
+                        metrics.inc('model_fallbacks_total', model=second.model_name)
+                        send(second)
+                    continue
+
+                for other_future, (_, cancel) in in_flight.items():
+                    cancel.set()
+                    other_future.cancel()
+                if client is not first:
+                    metrics.inc('model_hedge_wins_total', model=client.model_name)
+                return text
+        raise errors[0]
+
+    def stream_text(self, prompt: str, generation_config: Optional[Dict] = None,
+                    system_instruction: Optional[str] = None,
+                    on_usage: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+        """Stream from the preferred model, switching models if it fails before the first chunk.
+
+        Streams aren't hedged: their first chunk already arrives early.
+        """
+        first, second = self.route()
+        for client in (first, second):
+            latencies = []
+            streamed = False
+            try:
+                for chunk in client.stream_text(prompt, generation_config, system_instruction, on_usage,
+                                                latencies.append):
+                    streamed = True
+                    yield chunk
+            except GenerationError as e:
+                if not isinstance(e, NOT_MODEL_FAILURES):
+                    self.stats[client.model_name].record(False)
+                if streamed or client is second:
+                    raise
+                metrics.inc('model_fallbacks_total', model=second.model_name)
+                continue
+            self.stats[client.model_name].record(True, latencies[-1])
+            return
+
+    def routing_stats(self) -> List[Dict]:
+        """Per-model recent error rate, latency and hedge delay, in routing order"""
+        rows = []
+        for client in self.route():
+            stats = self.stats[client.model_name]
+            p50, p95 = stats.percentile(50), stats.percentile(95)
+            rows.append({
+                'model': client.model_name,
+                'requests': len(stats.outcomes),
+                'error_rate': stats.error_rate(),
+                'p50_ms': p50 * 1000 if p50 is not None else None,
+                'p95_ms': p95 * 1000 if p95 is not None else None,
+                'hedge_delay_ms': self.hedge_delay(client) * 1000,
+                'circuit': client.breaker.state
+            })
+        return rows
+
+# The shared client is created on first use: building it imports and configures the
+# Gemini SDK, which is the slowest part of a cold start and unused by most pages
+gemini_client: Optional[Union[GeminiClient, ModelRouter]] = None
+_gemini_client_lock = threading.Lock()
+
+def get_gemini_client() -> Union[GeminiClient, ModelRouter]:
+    """The process-wide client (MODEL_BACKEND=fake swaps in the offline fake model).
+
+    With a FALLBACK_MODEL configured it is a ModelRouter over both models.
+    """
+    global gemini_client
+    if gemini_client is None:
+        with _gemini_client_lock:
+            if gemini_client is None:
+                if config.MODEL_BACKEND == 'gemini' and not config.GEMINI_API_KEY:
+                    raise ConfigurationError("GEMINI_API_KEY is not set: export your Gemini API key, or "
+                                             "set LINKEDIN_AUTOMATION_MODEL_BACKEND=fake to run offline")
+                client = GeminiClient(make_backend(config.MODEL_BACKEND, config.GEMINI_API_KEY,
+                                                   config.GEMINI_MODEL))
+                if config.FALLBACK_MODEL:
+                    client = ModelRouter(client, GeminiClient(make_backend(
+                        config.MODEL_BACKEND, config.GEMINI_API_KEY, config.FALLBACK_MODEL)))
+                gemini_client = client
+    return gemini_client
+
+def routing_stats() -> List[Dict]:
+    """The shared client's per-model routing stats; empty until it is created or without a fallback"""
+    return gemini_client.routing_stats() if isinstance(gemini_client, ModelRouter) else []
+
+# Appended when a follow-up reply has to be re-prompted
+FOLLOW_UP_FORMAT_REMINDER = ("Reply with exactly 3 messages, each starting on its own line with the "
+                             "header FOLLOW-UP 1:, FOLLOW-UP 2: or FOLLOW-UP 3:.")
+
+# Ask Gemini for raw JSON instead of prose/markdown
+JSON_GENERATION_CONFIG = {'response_mime_type': 'application/json'}
+
+def load_json_response(text: str):
+    """Decode a JSON model response, raising ValueError if it isn't valid JSON"""
+    text = text.strip()
+    if text.startswith('```'):
+        # Strip a markdown code fence the model sometimes adds anyway
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text)
+
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Response is not valid JSON: {e}")
+
+@metrics.timed('parse_seconds', parser='combined')
+def parse_combined_response(text: str) -> Tuple[str, List[str]]:
+    """Validate a combined JSON response, raising ValueError if it doesn't match the schema"""
+    data = load_json_response(text)
+    if not isinstance(data, dict):
+        raise ValueError("Response must be a JSON object")
+
+    connection_message = data.get('connection_message')
+    if not isinstance(connection_message, str) or not connection_message.strip():
+        raise ValueError("'connection_message' must be a non-empty string")
+
+    follow_ups = data.get('follow_ups')
+    if (not isinstance(follow_ups, list) or len(follow_ups) != 3
+            or not all(isinstance(f, str) and f.strip() for f in follow_ups)):
+        raise ValueError("'follow_ups' must be a list of 3 non-empty strings")
+
+    return connection_message.strip(), [f.strip() for f in follow_ups]
+
+@metrics.timed('parse_seconds', parser='batch')
+def parse_batch_response(text: str) -> Dict[str, str]:
+    """Map prospect ids to connection messages, skipping malformed items"""
+    data = load_json_response(text)
+    if not isinstance(data, list):
+        raise ValueError("Response must be a JSON array")
+
+    messages = {}
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        prospect_id = item.get('id')
+        message = item.get('connection_message')
+        if isinstance(prospect_id, (str, int)) and isinstance(message, str) and message.strip():
+            messages[str(prospect_id)] = message.strip()
+    return messages
+
+class FollowUpParseError(GenerationError):
+    """The follow-up reply could not be split into its three messages"""
+
+    def __init__(self, reason: str, text: str):
+        super().__init__(f"Could not parse follow-up sequence: {reason}")
+        self.reason = reason
+        self.text = text
+
+# Follow-up reply parsing: each message starts with a header such as "FOLLOW-UP 1:",
+# "**Follow-up 2:**", "### Follow up #3" or "Follow-up 1 (2-3 days after connection):".
+# Headers normally start a line; mid-line they need the colon, so prose like
+# "follow up 2 weeks later" is never taken for one
+FOLLOW_UP_COUNT = 3
+_FOLLOW_UP_LABEL = r"""
+    follow[ \t-]*up[ \t]*(?:message[ \t]*)?(?:\#|no\.)?[ \t]*\d+
+    [ \t]*(?:\([^)\n]*\))?                  # "(2-3 days after connection)"
+    [ \t*_]*"""
+FOLLOW_UP_HEADER = re.compile(rf"""
+    ^[ \t>#*_-]*(?:\d+[.)][ \t*_]*)?            # at a line start, after any markdown heading, quote,
+        {_FOLLOW_UP_LABEL}                     # bullet, list number or bold
+        (?:[:.)\u2013\u2014-]|$)[ \t*_]*      # then ":", ".", ")", a dash or the line end
+    |(?<=\s){_FOLLOW_UP_LABEL}:[ \t*_]*         # mid-line: the colon is required
+""", re.IGNORECASE | re.MULTILINE | re.VERBOSE)
+TRAILING_RULE = re.compile(r"\n[ \t]*(?:[-*_][ \t]*){3,}$")
+
+@metrics.timed('parse_seconds', parser='follow_ups')
+def parse_follow_ups(text: str) -> List[str]:
+    """Split a follow-up reply into its three messages in a single scan.
+
+    Text before the first header is ignored. A JSON list of messages (or an
+    object with a 'follow_ups' list) is accepted too. Raises FollowUpParseError
+    if the reply doesn't hold exactly three non-empty messages.
+    """
+    headers = list(FOLLOW_UP_HEADER.finditer(text))
+    if not headers:
+        if text.lstrip().startswith(('{', '[', '```')):
+            return _parse_follow_ups_json(text)
+        raise FollowUpParseError("no follow-up headers found", text)
+    if len(headers) != FOLLOW_UP_COUNT:
+        raise FollowUpParseError(f"found {len(headers)} follow-ups, expected {FOLLOW_UP_COUNT}", text)
+
+    ends = [header.start() for header in headers[1:]] + [len(text)]
+    follow_ups = [TRAILING_RULE.sub('', text[header.end():end].strip()).strip()
+                  for header, end in zip(headers, ends)]
+    empty = [i for i, follow_up in enumerate(follow_ups, 1) if not follow_up]
+    if empty:
+        raise FollowUpParseError(f"follow-up {empty[0]} is empty", text)
+    return follow_ups
+
+def _parse_follow_ups_json(text: str) -> List[str]:
+    try:
+        data = load_json_response(text)
+    except ValueError as e:
+        raise FollowUpParseError(str(e), text)
+    if isinstance(data, dict):
+        data = data.get('follow_ups')
+    if (not isinstance(data, list) or len(data) != FOLLOW_UP_COUNT
+            or not all(isinstance(f, str) and f.strip() for f in data)):
+        raise FollowUpParseError(f"JSON must hold a list of {FOLLOW_UP_COUNT} non-empty strings", text)
+    return [f.strip() for f in data]
+
+@lru_cache(maxsize=PREFIXED_MODELS)
+def _campaign_prefix(product_description: str, target_industry: str, outreach_goal: str,
+                     brand_voice: str) -> str:
+    return f"""You write LinkedIn outreach messages for a B2B sales campaign.
+
+Campaign Context:
+- Product/Service: {product_description}
+- Target Industry: {target_industry}
+- Outreach Goal: {outreach_goal}
+- Brand Voice: {brand_voice}
+
+Every message must be professional but {brand_voice} in tone."""
+
+def campaign_prefix(campaign_data: Dict) -> str:
+    """The campaign block shared by all of a campaign's prompts, sent ahead of the per-prospect part"""
+    return _campaign_prefix(campaign_data['product_description'], campaign_data['target_industry'],
+                            campaign_data['outreach_goal'], campaign_data['brand_voice'])
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic: ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+@dataclass
+class Prospect:
+    name: str
+    title: str
+    company: str
+    industry: str
+    profile_summary: str
+    recent_activity: str = ""
+
+class MessageGenerator:
+    def __init__(self, api_key: str, cache: Optional[ResponseCache] = None,
+                 client: Optional[Union[GeminiClient, ModelRouter]] = None):
+        self.api_key = api_key
+        self.cache = cache if cache is not None else response_cache
+        self._client = client
+
+    @property
+    def client(self) -> Union[GeminiClient, ModelRouter]:
+        if self._client is None:
+            self._client = get_gemini_client()
+        return self._client
+
+    @client.setter
+    def client(self, client: Union[GeminiClient, ModelRouter]):
+        self._client = client
+
+    def _spend(self, campaign_data: Optional[Dict]) -> Optional[Callable[[int, int], None]]:
+        """Check the campaign's token budget and return a callback booking usage against it.
+
+        Requests already in flight when the budget runs out still complete, so a
+        concurrent run can overshoot by at most its concurrency.
+        """
+        campaign_id = campaign_data.get('id') if campaign_data else None
+        if campaign_id is None:
+            return None
+        budget = campaign_data.get('token_budget')
+        if budget and campaign_tokens_used(campaign_id) >= budget:
+            raise BudgetExceededError(f"Campaign {campaign_id} has used its budget of {budget:,} tokens")
+        return lambda input_tokens, output_tokens: record_token_usage(campaign_id, input_tokens, output_tokens)
+
+    def _cache_key(self, prompt: str, campaign_data: Optional[Dict] = None,
+                   generation_config: Optional[Dict] = None) -> str:
+        system_instruction = campaign_prefix(campaign_data) if campaign_data else None
+        return ResponseCache.make_key(self.client.model_name, prompt, generation_config, system_instruction)
+
+    def _generate_text(self, prompt: str, use_cache: bool = True,
+                       generation_config: Optional[Dict] = None,
+                       campaign_data: Optional[Dict] = None) -> str:
+        """Generate a reply to the per-prospect prompt, sending campaign_prefix(campaign_data) ahead of it"""
+        key = self._cache_key(prompt, campaign_data, generation_config)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        on_usage = self._spend(campaign_data)
+        text = self.client.generate_text(prompt, generation_config,
+                                         system_instruction=campaign_prefix(campaign_data) if campaign_data else None,
+                                         on_usage=on_usage)
+
+        # Bypassed lookups still refresh the stored entry
+        self.cache.set(key, text)
+        return text
+
+    @metrics.timed('prompt_build_seconds', prompt='connection')
+    def _connection_prompt(self, prospect: Prospect) -> str:
+        return f"""Generate a personalized LinkedIn connection request message.
+
+Prospect Details:
+- Name: {prospect.name}
+- Title: {prospect.title}
+- Company: {prospect.company}
+- Industry: {prospect.industry}
+- Profile Summary: {prospect.profile_summary}
+
+Requirements:
+- Maximum 300 characters (LinkedIn limit)
+- Personalized and relevant
+- Include specific value proposition
+- End with a soft call-to-action
+
+Generate only the message, no additional text."""
+
+    @metrics.timed('prompt_build_seconds', prompt='follow_ups')
+    def _follow_up_prompt(self, prospect: Prospect) -> str:
+        return f"""Generate 3 follow-up messages for LinkedIn outreach sequence.
+
+Prospect Details:
+- Name: {prospect.name}
+- Title: {prospect.title}
+- Company: {prospect.company}
+
+Generate 3 different follow-up messages:
+1. First follow-up (2-3 days after connection) - soft reminder with value
+2. Second follow-up (1 week later) - share case study or insight
+3. Final follow-up (2 weeks later) - last attempt with different angle
+
+Each message should be:
+- Under 200 words
+- Provide value, not just ask for time
+- Have clear but not pushy CTA
+
+Format as: 
+FOLLOW-UP 1:
+[message]
+
+FOLLOW-UP 2:
+[message]
+
+FOLLOW-UP 3:
+[message]"""
+
+    def generate_connection_message(self, prospect: Prospect, campaign_data: Dict,
+                                    use_cache: bool = True) -> str:
+        return self._generate_text(self._connection_prompt(prospect), use_cache=use_cache,
+                                   campaign_data=campaign_data)
+
+    def generate_follow_up_sequence(self, prospect: Prospect, campaign_data: Dict,
+                                    use_cache: bool = True) -> List[str]:
+        text = self._generate_text(self._follow_up_prompt(prospect), use_cache=use_cache,
+                                   campaign_data=campaign_data)
+        return self.finish_follow_ups(text, prospect, campaign_data, use_cache)
+
+    def finish_follow_ups(self, text: str, prospect: Prospect, campaign_data: Dict,
+                          use_cache: bool = True) -> List[str]:
+        """Parse a follow-up reply, re-prompting this prospect once if it is malformed.
+
+        Raises FollowUpParseError if the second reply can't be parsed either, so
+        callers fail the prospect rather than storing the unparsed text.
+        """
+        try:
+            return parse_follow_ups(text)
+        except FollowUpParseError as e:
+            metrics.inc('parse_failures_total', parser='follow_ups')
+            prompt = self._follow_up_prompt(prospect)
+            # Don't serve the malformed reply from the cache again
+            self.cache.delete(self._cache_key(prompt, campaign_data))
+            retry_prompt = f"{prompt}\n\nYour previous reply could not be used ({e.reason}). {FOLLOW_UP_FORMAT_REMINDER}"
+            return parse_follow_ups(self._generate_text(retry_prompt, use_cache=use_cache,
+                                                        campaign_data=campaign_data))
+
+    def _stream_text(self, prompt: str, campaign_data: Dict, use_cache: bool = True) -> Iterator[str]:
+        key = self._cache_key(prompt, campaign_data)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        for chunk in self.client.stream_text(prompt, system_instruction=campaign_prefix(campaign_data),
+                                             on_usage=self._spend(campaign_data)):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.set(key, ''.join(chunks).strip())
+
+    def stream_messages(self, prospect: Prospect, campaign_data: Dict,
+                        use_cache: bool = True) -> Iterator[Tuple[str, str]]:
+        """Stream the connection note and follow-up sequence in parallel.
+
+        Yields (part, chunk) pairs in arrival order, where part is
+        'connection_message' or 'follow_ups'. Pass the joined follow-up text
+        to finish_follow_ups once the stream ends.
+        """
+        prompts = {
+            'connection_message': self._connection_prompt(prospect),
+            'follow_ups': self._follow_up_prompt(prospect)
+        }
+        chunks = queue.Queue()
+        stop = threading.Event()
+        finished = object()
+
+        def pump(part, prompt):
+            stream = self._stream_text(prompt, campaign_data, use_cache)
+            try:
+                for chunk in stream:
+                    if stop.is_set():
+                        break
+                    chunks.put((part, chunk))
+            except Exception as e:
+                chunks.put((part, e))
+            finally:
+                # Closes the model's response stream too when we stop early
+                stream.close()
+                chunks.put((part, finished))
+
+        executor = ThreadPoolExecutor(max_workers=len(prompts))
+        for part, prompt in prompts.items():
+            executor.submit(pump, part, prompt)
+        try:
+            remaining = len(prompts)
+            while remaining:
+                part, item = chunks.get()
+                if item is finished:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield part, item
+        finally:
+            # If we failed or the caller stopped early, the other stream may be
+            # blocked waiting for its next chunk: return now and let it drop that
+            # chunk and close in the background
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_messages(self, prospect: Prospect, campaign_data: Dict,
+                          use_cache: bool = True) -> Tuple[str, List[str]]:
+        """Generate the connection note and follow-up sequence in one request"""
+        prompt = f"""Generate a personalized LinkedIn outreach sequence: one connection request
+and 3 follow-up messages.
+
+Prospect Details:
+- Name: {prospect.name}
+- Title: {prospect.title}
+- Company: {prospect.company}
+- Industry: {prospect.industry}
+- Profile Summary: {prospect.profile_summary}
+
+Connection request requirements:
+- Maximum 300 characters (LinkedIn limit)
+- Personalized and relevant
+- Include specific value proposition
+- End with a soft call-to-action
+
+Follow-up messages:
+1. First follow-up (2-3 days after connection) - soft reminder with value
+2. Second follow-up (1 week later) - share case study or insight
+3. Final follow-up (2 weeks later) - last attempt with different angle
+
+Each follow-up should be:
+- Under 200 words
+- Provide value, not just ask for time
+- Have clear but not pushy CTA
+
+Respond with JSON only, using exactly this structure:
+{{"connection_message": "...", "follow_ups": ["...", "...", "..."]}}"""
+
+        text = self._generate_text(prompt, use_cache=use_cache,
+                                   generation_config=JSON_GENERATION_CONFIG, campaign_data=campaign_data)
+
+        try:
+            return parse_combined_response(text)
+        except ValueError:
+            # Fall back to the two-call path when the model ignores the schema, and
+            # don't serve the malformed reply from the cache again
+            self.cache.delete(self._cache_key(prompt, campaign_data, JSON_GENERATION_CONFIG))
+            return (self.generate_connection_message(prospect, campaign_data, use_cache),
+                    self.generate_follow_up_sequence(prospect, campaign_data, use_cache))
+
+    def _batch_header(self) -> str:
+        return """Generate a personalized LinkedIn connection request message for each prospect below.
+
+Requirements for every message:
+- Maximum 300 characters (LinkedIn limit)
+- Personalized and relevant to that prospect
+- Include specific value proposition
+- End with a soft call-to-action
+
+Respond with JSON only: an array with one object per prospect, using exactly this structure:
+[{"id": "<prospect id>", "connection_message": "..."}]
+
+Prospects:
+"""
+
+    def _prospect_batch_entry(self, prospect_id: str, prospect: Prospect) -> str:
+        return f"""
+[id: {prospect_id}]
+- Name: {prospect.name}
+- Title: {prospect.title}
+- Company: {prospect.company}
+- Industry: {prospect.industry}
+- Profile Summary: {prospect.profile_summary}
+"""
+
+    def plan_batches(self, prospects: List[Prospect], campaign_data: Dict,
+                     max_batch_size: int = DEFAULT_BATCH_SIZE) -> List[List[int]]:
+        """Group prospect indexes into batches that fit the model's token limits"""
+        header_tokens = estimate_tokens(campaign_prefix(campaign_data)) + estimate_tokens(self._batch_header())
+        # Leave headroom for the estimates being off
+        input_budget = int(MODEL_INPUT_TOKEN_LIMIT * 0.8) - header_tokens
+        max_by_output = max(1, int(MODEL_OUTPUT_TOKEN_LIMIT * 0.8) // BATCH_OUTPUT_TOKENS_PER_PROSPECT)
+        max_batch_size = max(1, min(max_batch_size, max_by_output))
+
+        batches = []
+        current, current_tokens = [], 0
+        for index, prospect in enumerate(prospects):
+            tokens = estimate_tokens(self._prospect_batch_entry(str(index), prospect))
+            if current and (len(current) >= max_batch_size or current_tokens + tokens > input_budget):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _generate_single(self, prospect: Prospect, campaign_data: Dict, use_cache: bool = True):
+        try:
+            return self.generate_connection_message(prospect, campaign_data, use_cache)
+        except GenerationError as e:
+            return e
+
+    def _generate_batch(self, batch: List[Tuple[int, Prospect]], campaign_data: Dict,
+                        use_cache: bool = True) -> Dict[int, object]:
+        if len(batch) == 1:
+            index, prospect = batch[0]
+            return {index: self._generate_single(prospect, campaign_data, use_cache)}
+
+        prompt = self._batch_header() + "".join(
+            self._prospect_batch_entry(str(index), prospect) for index, prospect in batch)
+
+        try:
+            text = self._generate_text(prompt, use_cache=use_cache,
+                                       generation_config=JSON_GENERATION_CONFIG, campaign_data=campaign_data)
+        except GenerationError as e:
+            return {index: e for index, _ in batch}
+
+        try:
+            messages = parse_batch_response(text)
+        except ValueError:
+            # Usually a truncated reply: retry each half as a smaller batch, and
+            # don't serve the truncated reply from the cache again
+            self.cache.delete(self._cache_key(prompt, campaign_data, JSON_GENERATION_CONFIG))
+            middle = len(batch) // 2
+            results = self._generate_batch(batch[:middle], campaign_data, use_cache)
+            results.update(self._generate_batch(batch[middle:], campaign_data, use_cache))
+            return results
+
+        results = {}
+        for index, prospect in batch:
+            if str(index) in messages:
+                results[index] = messages[str(index)]
+            else:
+                # Missing or malformed item: retry just this prospect
+                results[index] = self._generate_single(prospect, campaign_data, use_cache)
+        return results
+
+    def generate_batched(self, prospects: List[Prospect], campaign_data: Dict,
+                         max_batch_size: int = DEFAULT_BATCH_SIZE,
+                         max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                         progress_callback: Optional[Callable[[int, int], None]] = None,
+                         use_cache: bool = True, return_exceptions: bool = False) -> List:
+        """Generate connection messages with several prospects packed into each request"""
+        results: List = [None] * len(prospects)
+        total = len(prospects)
+        completed = 0
+
+        batches = self.plan_batches(prospects, campaign_data, max_batch_size)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = [
+                executor.submit(self._generate_batch, [(i, prospects[i]) for i in batch],
+                                campaign_data, use_cache)
+                for batch in batches
+            ]
+            for future in as_completed(futures):
+                for index, message in future.result().items():
+                    results[index] = message
+                    completed += 1
+                if progress_callback:
+                    progress_callback(completed, total)
+
+        return self._check_results(results, return_exceptions)
+
+    def _iter_concurrent(self, generate: Callable, prospects: List[Prospect], campaign_data: Dict,
+                         max_concurrency: int, use_cache: bool) -> Iterator[Tuple[int, object]]:
+        max_concurrency = max(1, max_concurrency)
+        in_flight = {}
+        pending = iter(enumerate(prospects))
+
+        def run(prospect):
+            # Failures are returned rather than raised so one prospect can't sink a bulk run
+            try:
+                return generate(prospect, campaign_data, use_cache)
+            except GenerationError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            def fill():
+                # Keep at most max_concurrency requests in flight so large runs
+                # don't queue thousands of futures up front
+                for index, prospect in pending:
+                    in_flight[executor.submit(run, prospect)] = index
+                    if len(in_flight) >= max_concurrency:
+                        break
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+                fill()
+
+    def iter_generate(self, prospects: List[Prospect], campaign_data: Dict,
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                      use_cache: bool = True) -> Iterator[Tuple[int, object]]:
+        """Yield (index, connection_message) pairs as generations complete.
+
+        A prospect that fails yields its GenerationError in place of the message.
+        """
+        return self._iter_concurrent(self.generate_connection_message, prospects, campaign_data,
+                                     max_concurrency, use_cache)
+
+    def iter_generate_sequences(self, prospects: List[Prospect], campaign_data: Dict,
+                                max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                use_cache: bool = True) -> Iterator[Tuple[int, object]]:
+        """Like iter_generate, yielding (connection_message, follow_ups) for each prospect"""
+        return self._iter_concurrent(self.generate_messages, prospects, campaign_data,
+                                     max_concurrency, use_cache)
+
+    def generate_many(self, prospects: List[Prospect], campaign_data: Dict,
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                      progress_callback: Optional[Callable[[int, int], None]] = None,
+                      use_cache: bool = True, return_exceptions: bool = False) -> List:
+        """Generate connection messages for many prospects, preserving input order"""
+        results: List = [None] * len(prospects)
+        total = len(prospects)
+
+        # The callback runs on the calling thread, so it can safely update
+        # Streamlit widgets such as st.progress
+        for completed, (index, message) in enumerate(
+                self.iter_generate(prospects, campaign_data, max_concurrency, use_cache), 1):
+            results[index] = message
+            if progress_callback:
+                progress_callback(completed, total)
+
+        return self._check_results(results, return_exceptions)
+
+    @staticmethod
+    def _check_results(results: List, return_exceptions: bool) -> List:
+        # Like asyncio.gather: either hand failures back in place or raise the first one
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, GenerationError):
+                    raise result
+        return results
+
+class JobWorker:
+    """Processes queued generation jobs, committing each prospect as it completes"""
+
+    def __init__(self, message_gen: MessageGenerator, poll_interval: float = 5.0,
+                 progress_callback: Optional[Callable[[int, str], None]] = None):
+        self.message_gen = message_gen
+        self.poll_interval = poll_interval
+        # Called with (job_id, 'done' | 'failed' | 'paused') after every item
+        self.progress_callback = progress_callback
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> bool:
+        """Process one job; returns False when there was nothing to do"""
+        job = claim_next_job()
+        if job is None:
+            return False
+        self._process(job)
+        return True
+
+    def run_job(self, job_id: int) -> Optional[str]:
+        """Process the given job until it finishes or pauses and return its status.
+
+        Returns None if the job isn't runnable, e.g. another worker holds it.
+        """
+        job = claim_next_job(job_id)
+        if job is None:
+            return None
+        return self._process(job)
+
+    def _report(self, job_id: int, outcome: str):
+        if self.progress_callback:
+            self.progress_callback(job_id, outcome)
+
+    def _process(self, job: Dict) -> str:
+        campaign_data = load_campaign(job['campaign_id'])
+        if campaign_data is None:
+            set_job_status(job['id'], 'failed')
+            return 'failed'
+
+        while not self._stop.is_set():
+            items = load_pending_job_items(job['id'])
+            if not items:
+                set_job_status(job['id'], 'completed')
+                return 'completed'
+
+            prospects = [Prospect(
+                name=data['name'],
+                title=data['title'],
+                company=data['company'],
+                industry=data['industry'],
+                profile_summary=data.get('profile_summary') or '',
+                recent_activity=data.get('recent_activity') or ''
+            ) for _, data in items]
+
+            paused = over_budget = False
+            for index, result in self.message_gen.iter_generate_sequences(
+                    prospects, campaign_data, max_concurrency=job['max_concurrency'],
+                    use_cache=not job.get('bypass_cache')):
+                item_id, data = items[index]
+                if isinstance(result, BudgetExceededError):
+                    # Left pending until the campaign's budget is raised
+                    over_budget = True
+                    self._report(job['id'], 'paused')
+                elif isinstance(result, (CircuitOpenError, RateLimitError, ConfigurationError)):
+                    # The API is down, out of quota or not configured: leave the item pending for later
+                    paused = True
+                    self._report(job['id'], 'paused')
+                elif isinstance(result, GenerationError):
+                    fail_job_item(job['id'], item_id, str(result))
+                    self._report(job['id'], 'failed')
+                else:
+                    connection_msg, follow_ups = result
+                    complete_job_item(job['id'], item_id, dict(
+                        data, connection_message=connection_msg, follow_up_messages=follow_ups
+                    ), job['campaign_id'])
+                    self._report(job['id'], 'done')
+
+            if over_budget:
+                set_job_status(job['id'], 'over_budget')
+                return 'over_budget'
+            if paused:
+                set_job_status(job['id'], 'pending')
+                self._stop.wait(self.poll_interval)
+                return 'pending'
+
+        # Stopped mid-run; leave the job for the next worker to resume
+        set_job_status(job['id'], 'pending')
+        return 'pending'
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="job-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
@@ -0,0 +1,184 @@
+"""
+In-process metrics for LinkedIn Sales Automation Tool
+
+Counters and latency histograms for model calls, database operations and page
+renders. Everything is kept in memory for the Performance page, can be
+exported in Prometheus text format (optionally over HTTP), and can be
+appended to a JSONL log for offline analysis.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from .config import METRICS_LOG_PATH
+
+# Upper bounds in seconds, from sub-millisecond DB reads to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Raw samples kept per histogram for percentiles and the live charts
+RECENT_SAMPLES = 1000
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape_label_value(value: str) -> str:
+    # The text format requires backslash, double quote and newline to be escaped
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in pairs) + '}'
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, pct: float) -> float:
+        """Percentile of the recent samples (nearest rank)"""
+        samples = sorted(self.recent)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by name and labels"""
+
+    def __init__(self, log_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._log = open(log_path, 'a', buffering=1, encoding='utf-8') if log_path else None
+
+    def _write_log(self, kind: str, name: str, value: float, labels: Dict):
+        if self._log is not None:
+            self._log.write(json.dumps({'ts': time.time(), 'type': kind, 'metric': name,
+                                        'value': value, 'labels': labels}) + '\n')
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+            self._write_log('counter', name, value, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+            self._write_log('histogram', name, value, labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block in seconds, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator form of timer()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self) -> List[Dict]:
+        """One row per histogram series with count, mean and recent percentiles"""
+        with self._lock:
+            return [
+                {'metric': name, 'labels': _format_labels(key), 'count': histogram.count,
+                 'mean_ms': histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                 'p50_ms': histogram.percentile(50) * 1000, 'p95_ms': histogram.percentile(95) * 1000,
+                 'p99_ms': histogram.percentile(99) * 1000}
+                for name, series in sorted(self.histograms.items())
+                for key, histogram in sorted(series.items())
+            ]
+
+    def counter_rows(self) -> List[Dict]:
+        with self._lock:
+            return [{'metric': name, 'labels': _format_labels(key), 'value': value}
+                    for name, series in sorted(self.counters.items())
+                    for key, value in sorted(series.items())]
+
+    def recent_samples(self, name: str) -> Dict[str, List[float]]:
+        """Recent raw samples of every series of a histogram, keyed by its label string"""
+        with self._lock:
+            return {_format_labels(key): list(histogram.recent)
+                    for key, histogram in sorted(self.histograms.get(name, {}).items())}
+
+    def to_prometheus(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.bucket_counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+def serve_prometheus(registry: MetricsRegistry, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve registry.to_prometheus() at http://host:port/metrics from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+metrics = MetricsRegistry(METRICS_LOG_PATH)
@@ -0,0 +1,204 @@
+"""
+Model backends used by the message generator
+
+A backend is anything with a `model_name` and a `generate_content(prompt,
+generation_config=None, stream=False)` method returning a response with
+`.text` (or an iterable of such chunks when streaming), which is the
+interface of google.generativeai.GenerativeModel. FakeBackend implements it
+locally so tests and benchmarks run offline with predictable timing.
+
+Backends may also offer `with_system_instruction(text)`, returning a variant
+that sends `text` ahead of every prompt without it being part of the prompt.
+GeminiClient uses it for the per-campaign prompt prefix.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Dict, Iterator, Optional
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+
+# Gemini context caching only accepts contents of at least this many tokens;
+# shorter prefixes are sent as a plain system instruction
+CACHED_CONTENT_MIN_TOKENS = 32768
+CACHED_CONTENT_TTL = timedelta(hours=1)
+# A cached-content variant is rebuilt this long before its cache expires
+CACHED_CONTENT_REFRESH = timedelta(minutes=5)
+
+class ModelBackend(ABC):
+    """Interface expected by GeminiClient; subclasses without generate_content can't be created"""
+
+    model_name = ''
+
+    @abstractmethod
+    def generate_content(self, prompt: str, generation_config: Optional[Dict] = None,
+                         stream: bool = False):
+        """The model's response to prompt, or an iterator of response chunks when streaming"""
+
+class SystemInstructionBackend(ModelBackend):
+    """A backend variant that carries a fixed system instruction"""
+
+    def __init__(self, backend: ModelBackend, system_instruction: str):
+        self.backend = backend
+        self.system_instruction = system_instruction
+        self.model_name = backend.model_name
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict] = None,
+                         stream: bool = False):
+        return self.backend.generate_content(prompt, generation_config, stream)
+
+class GeminiBackend(ModelBackend):
+    """google.generativeai.GenerativeModel with per-prefix variants.
+
+    A prefix long enough for Gemini context caching is uploaded once as cached
+    content; shorter ones (or models without caching) use system_instruction.
+    A cached-content variant sets expires_at (time.monotonic()) so callers
+    holding on to it know when to ask for a fresh one.
+    """
+
+    def __init__(self, model, expires_at: Optional[float] = None):
+        self.model = model
+        self.model_name = model.model_name
+        self.expires_at = expires_at
+
+    def generate_content(self, prompt: str, **kwargs):
+        return self.model.generate_content(prompt, **kwargs)
+
+    def with_system_instruction(self, system_instruction: str) -> 'GeminiBackend':
+        import google.generativeai as genai
+        from google.api_core import exceptions as api_exceptions
+
+        if _tokens(system_instruction) >= CACHED_CONTENT_MIN_TOKENS:
+            try:
+                cached = genai.caching.CachedContent.create(model=self.model_name,
+                                                            system_instruction=system_instruction,
+                                                            ttl=CACHED_CONTENT_TTL)
+                expires_at = time.monotonic() + (CACHED_CONTENT_TTL - CACHED_CONTENT_REFRESH).total_seconds()
+                return GeminiBackend(genai.GenerativeModel.from_cached_content(cached), expires_at)
+            except (api_exceptions.GoogleAPIError, ValueError):
+                pass
+        return GeminiBackend(genai.GenerativeModel(self.model_name, system_instruction=system_instruction))
+
+class FakeApiError(Exception):
+    """Transient API failure carrying an HTTP status code like google.api_core errors"""
+
+    def __init__(self, code: int = 503):
+        super().__init__(f"HTTP {code} (simulated)")
+        self.code = code
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeBackend(ModelBackend):
+    """Deterministic local model with configurable latency, error rate and throughput.
+
+    Each call waits `latency` seconds (+/- `jitter` as a fraction) before the
+    first token, then streams the reply at `tokens_per_second`. A `slow_rate`
+    share of calls waits `slow_factor` times longer, to model a latency tail. A
+    seeded RNG decides which calls fail or are slow, so runs with the same seed
+    are repeatable.
+    """
+
+    model_name = 'models/fake'
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.2, error_rate: float = 0.0,
+                 tokens_per_second: float = 2000.0, seed: int = 0, chunk_tokens: int = 8,
+                 slow_rate: float = 0.0, slow_factor: float = 10.0, model_name: Optional[str] = None):
+        if model_name:
+            self.model_name = model_name
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.sleep = time.sleep
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            delay = self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter))
+            if self.slow_rate and self._rng.random() < self.slow_rate:
+                delay *= self.slow_factor
+        return failed, max(0.0, delay)
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict] = None,
+                         stream: bool = False):
+        failed, delay = self._draw()
+        text = fake_reply(prompt, generation_config)
+        if not stream:
+            self.sleep(delay + _tokens(text) / self.tokens_per_second)
+            if failed:
+                raise FakeApiError()
+            return FakeResponse(text)
+        return self._stream(text, delay, failed)
+
+    def with_system_instruction(self, system_instruction: str) -> SystemInstructionBackend:
+        # The reply only depends on the prompt, so the variant shares this backend's state
+        return SystemInstructionBackend(self, system_instruction)
+
+    def _stream(self, text: str, delay: float, failed: bool) -> Iterator[FakeResponse]:
+        self.sleep(delay)
+        if failed:
+            raise FakeApiError()
+        words = text.split(' ')
+        words_per_chunk = max(1, self.chunk_tokens * 3 // 4)
+        for start in range(0, len(words), words_per_chunk):
+            chunk = ' '.join(words[start:start + words_per_chunk])
+            if start + words_per_chunk < len(words):
+                chunk += ' '
+            self.sleep(_tokens(chunk) / self.tokens_per_second)
+            yield FakeResponse(chunk)
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _connection_message(name: str) -> str:
+    return (f"Hi {name}, I enjoyed reading about your work and would love to connect "
+            f"and swap notes on what's working for your team.")
+
+def fake_reply(prompt: str, generation_config: Optional[Dict] = None) -> str:
+    """A well-formed reply to any of the generator's prompts, derived from the prospect names"""
+    json_mode = (generation_config or {}).get('response_mime_type') == 'application/json'
+    names = re.findall(r'- Name: (.*)', prompt)
+
+    if json_mode and '[id: ' in prompt:
+        ids = re.findall(r'\[id: (.*?)\]', prompt)
+        return json.dumps([{'id': prospect_id, 'connection_message': _connection_message(name)}
+                           for prospect_id, name in zip(ids, names)])
+
+    name = names[0] if names else 'there'
+    follow_ups = [f"Following up, {name}: one idea that helped similar teams.",
+                  f"{name}, here's a short case study you might find useful.",
+                  f"Last note from me, {name} - happy to share more whenever it suits."]
+    if json_mode:
+        return json.dumps({'connection_message': _connection_message(name), 'follow_ups': follow_ups})
+    if 'FOLLOW-UP 1:' in prompt:
+        return '\n\n'.join(f"FOLLOW-UP {i}:\n{text}" for i, text in enumerate(follow_ups, 1))
+    return _connection_message(name)
+
+def make_backend(name: str, api_key: str, model_name: str = GEMINI_MODEL_NAME, **fake_options):
+    """Create the backend selected by name: 'gemini' or 'fake'"""
+    if name == 'fake':
+        # Other models get their own name so their metrics and routing stats stay apart
+        fake_name = None if model_name == GEMINI_MODEL_NAME else f"models/fake-{model_name}"
+        return FakeBackend(model_name=fake_name, **fake_options)
+    if name == 'gemini':
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return GeminiBackend(genai.GenerativeModel(model_name))
+    raise ValueError(f"Unknown model backend: {name}")
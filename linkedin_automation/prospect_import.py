@@ -0,0 +1,123 @@
+"""
+Streaming prospect import from CSV and Excel files
+
+Rows are read one at a time and written through the bulk insert path in
+chunks, so memory use stays flat regardless of file size.
+"""
+
+import codecs
+import csv
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .database import save_prospects_bulk, BULK_CHUNK_SIZE
+
+# Prospect dataclass fields plus the profile URL used for de-duplication
+PROSPECT_FIELDS = ['name', 'title', 'company', 'industry', 'profile_summary',
+                   'recent_activity', 'profile_url']
+REQUIRED_FIELDS = ['name', 'title', 'company']
+
+# Header spellings commonly exported by LinkedIn/Sales Navigator/CRMs
+COLUMN_ALIASES = {
+    'name': ['name', 'full name', 'fullname', 'prospect', 'contact name'],
+    'title': ['title', 'job title', 'position', 'role', 'headline'],
+    'company': ['company', 'company name', 'organization', 'organisation', 'employer'],
+    'industry': ['industry', 'sector'],
+    'profile_summary': ['profile summary', 'summary', 'bio', 'about', 'description'],
+    'recent_activity': ['recent activity', 'activity', 'recent posts', 'posts'],
+    'profile_url': ['profile url', 'linkedin url', 'linkedin profile', 'url', 'linkedin']
+}
+
+MAX_REPORTED_ERRORS = 100
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    # Only the first MAX_REPORTED_ERRORS are kept so huge bad files don't grow memory
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+def _normalize_header(header: str) -> str:
+    return re.sub(r'[\s_\-]+', ' ', (header or '').strip().lower())
+
+def guess_mapping(columns: List[str]) -> Dict[str, Optional[str]]:
+    """Match file columns to prospect fields by common header names"""
+    normalized = {_normalize_header(column): column for column in columns}
+    return {
+        prospect_field: next((normalized[alias] for alias in aliases if alias in normalized), None)
+        for prospect_field, aliases in COLUMN_ALIASES.items()
+    }
+
+def _iter_csv(file) -> Tuple[List[str], Iterator[Dict]]:
+    # Decode line by line (utf-8-sig drops the BOM Excel adds to CSV exports). Unlike
+    # io.TextIOWrapper this doesn't close the upload when it is garbage collected.
+    lines = codecs.iterdecode(file, 'utf-8-sig', errors='replace')
+    reader = csv.DictReader(lines)
+    return list(reader.fieldnames or []), reader
+
+def _iter_excel(file) -> Tuple[List[str], Iterator[Dict]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Excel import requires openpyxl: pip install openpyxl")
+
+    # read_only mode streams rows instead of loading the whole sheet
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    columns = [str(value) if value is not None else '' for value in header]
+
+    def records():
+        try:
+            for values in rows:
+                yield {column: value for column, value in zip(columns, values)}
+        finally:
+            workbook.close()
+
+    return columns, records()
+
+def open_rows(file, filename: str) -> Tuple[List[str], Iterator[Dict]]:
+    """Return the column names and a lazy iterator over the rows of an upload"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return _iter_excel(file)
+    return _iter_csv(file)
+
+def map_row(row: Dict, mapping: Dict[str, Optional[str]]) -> Dict[str, str]:
+    prospect = {}
+    for prospect_field in PROSPECT_FIELDS:
+        column = mapping.get(prospect_field)
+        value = row.get(column) if column else None
+        prospect[prospect_field] = str(value).strip() if value is not None else ''
+    return prospect
+
+def validate_prospect(prospect: Dict[str, str]) -> Optional[str]:
+    """Return a description of what's wrong with the row, or None if it's usable"""
+    missing = [prospect_field for prospect_field in REQUIRED_FIELDS if not prospect[prospect_field]]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if prospect['profile_url'] and 'linkedin.com/' not in prospect['profile_url'].lower():
+        return "profile URL is not a LinkedIn URL"
+    return None
+
+def iter_valid_prospects(rows: Iterator[Dict], mapping: Dict[str, Optional[str]],
+                         result: ImportResult) -> Iterator[Dict[str, str]]:
+    # Row 1 is the header, so data starts at row 2 like in a spreadsheet
+    for row_number, row in enumerate(rows, 2):
+        prospect = map_row(row, mapping)
+        error = validate_prospect(prospect)
+        if error:
+            result.skipped += 1
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append((row_number, error))
+            continue
+        yield prospect
+
+def import_prospects(rows: Iterator[Dict], mapping: Dict[str, Optional[str]], campaign_id: int,
+                     chunk_size: int = BULK_CHUNK_SIZE,
+                     progress_callback: Optional[Callable[[int], None]] = None) -> ImportResult:
+    """Validate and bulk insert rows as pending prospects of the campaign"""
+    result = ImportResult()
+    result.imported = save_prospects_bulk(iter_valid_prospects(rows, mapping, result), campaign_id,
+                                          chunk_size=chunk_size, progress_callback=progress_callback)
+    return result
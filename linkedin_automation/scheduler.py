@@ -0,0 +1,58 @@
+"""
+Send queue for connection requests and follow-up sequences
+
+A generated connection request is due straight away. Sending it schedules
+follow-up 1 on the FOLLOW_UP_DELAYS_DAYS cadence (3 days, then 1 and 2 weeks
+after the previous message), and each follow-up sent schedules the next.
+Due messages come from indexed queries and are capped at what is left of
+the account's daily limits (DAILY_LIMITS, as on the Dashboard); every send is
+counted per day, and a send past the limit is refused.
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from . import database
+from .config import ACCOUNT_TYPE, DAILY_LIMITS
+
+MESSAGE_TYPES = ['connection', 'follow_up']
+
+class DailyLimitError(Exception):
+    """Today's limit for this message type is used up"""
+
+class OutreachScheduler:
+    """Hands out due messages within the account's daily limits and records sends"""
+
+    def __init__(self, account_type: str = ACCOUNT_TYPE, clock: Callable[[], datetime] = datetime.now):
+        self.limits = DAILY_LIMITS[account_type]
+        self.clock = clock
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Sent today and the daily limit, per message type"""
+        counts = database.load_send_counts(self.clock().date().isoformat())
+        return {message_type: {'sent': counts.get(message_type, 0), 'limit': self.limits[message_type]}
+                for message_type in MESSAGE_TYPES}
+
+    def remaining(self) -> Dict[str, int]:
+        return {message_type: max(0, usage['limit'] - usage['sent'])
+                for message_type, usage in self.usage().items()}
+
+    def due_now(self) -> Dict[str, List[Dict]]:
+        """Messages to send now, per message type, never more than today's remaining limit"""
+        remaining = self.remaining()
+        return {
+            'connection': database.load_due_connections(remaining['connection'])
+            if remaining['connection'] else [],
+            'follow_up': database.load_due_follow_ups(self.clock().isoformat(), remaining['follow_up'])
+            if remaining['follow_up'] else []
+        }
+
+    def mark_sent(self, message_type: str, item_id: int):
+        """Record a connection request (prospect id) or follow-up (message id) as sent now"""
+        outcome = database.mark_sent(message_type, item_id, self.limits[message_type],
+                                     self.clock().isoformat())
+        if outcome == 'limit':
+            raise DailyLimitError(f"Daily {message_type.replace('_', ' ')} limit of "
+                                  f"{self.limits[message_type]} reached")
+        if outcome == 'not_due':
+            raise ValueError(f"{message_type} {item_id} is not due")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the headless command line interface
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from linkedin_automation import cli, database, generation
+from linkedin_automation.model_backends import FakeBackend
+
+@pytest.fixture
+def db_path(db, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    client = generation.GeminiClient(FakeBackend(latency=0.0, tokens_per_second=10 ** 6),
+                                     requests_per_minute=10 ** 9)
+    monkeypatch.setattr(generation, "gemini_client", client)
+    monkeypatch.setattr(generation, "response_cache", generation.ResponseCache(str(tmp_path / "cache.db")))
+    return db
+
+def test_generate_imports_and_generates(db_path, campaign_data, tmp_path, capsys):
+    """`generate` imports the file, then writes messages for every prospect"""
+    campaign_id = database.save_campaign(campaign_data)
+    database.close_connections()
+    prospects = tmp_path / "prospects.csv"
+    prospects.write_text("Name,Title,Company,LinkedIn URL\n" + "".join(
+        f"Prospect {i},CTO,Company {i},https://www.linkedin.com/in/p{i}\n" for i in range(6)))
+
+    code = cli.main(['--db', db_path, 'generate', '--campaign', str(campaign_id),
+                     '--input', str(prospects), '--concurrency', '3'])
+
+    assert code == 0
+    output = capsys.readouterr().out
+    assert "Imported 6 prospects" in output
+    assert "6 generated, 0 failed" in output
+    rows = database.query("SELECT status, connection_message FROM prospects WHERE campaign_id = ?",
+                          (campaign_id,))
+    assert [row['status'] for row in rows] == ['draft'] * 6
+    assert all(row['connection_message'].startswith("Hi Prospect") for row in rows)
+
+    # Nothing left to do on a re-run
+    assert cli.main(['--db', db_path, 'generate', '--campaign', str(campaign_id)]) == 0
+    assert "No pending prospects" in capsys.readouterr().out
+
+def test_commands_refuse_to_start_without_an_api_key(db_path, campaign_data, monkeypatch, capsys):
+    """`generate` and `worker` exit with a clear error when GEMINI_API_KEY is missing"""
+    from linkedin_automation import config
+
+    monkeypatch.setattr(generation, "gemini_client", None)
+    monkeypatch.setattr(config, "MODEL_BACKEND", "gemini")
+    monkeypatch.setattr(config, "GEMINI_API_KEY", "")
+    campaign_id = database.save_campaign(campaign_data)
+
+    assert cli.main(['--db', db_path, 'generate', '--campaign', str(campaign_id)]) == 2
+    assert cli.main(['--db', db_path, 'worker']) == 2
+    assert capsys.readouterr().err.count("GEMINI_API_KEY is not set") == 2
+    assert generation.gemini_client is None
+
+def test_generate_rejects_unknown_campaign(db_path, capsys):
+    assert cli.main(['--db', db_path, 'generate', '--campaign', '99']) == 2
+    assert "Campaign 99 not found" in capsys.readouterr().err
+
+def test_compact_repairs_the_daily_stats_rollup(db_path, campaign_data, capsys):
+    """`compact` drops rollup counts for rows deleted outside the app"""
+    campaign_id = database.save_campaign(campaign_data)
+    database.save_prospects_bulk([
+        {'name': f'Prospect {i}', 'title': 'CTO', 'company': 'Acme', 'industry': 'SaaS',
+         'profile_url': f'https://www.linkedin.com/in/p{i}'}
+        for i in range(3)], campaign_id)
+    with database.transaction() as c:
+        c.execute("DELETE FROM prospects WHERE name = 'Prospect 0'")
+    assert database.load_daily_totals()['prospects_added'] == 3
+
+    assert cli.main(['--db', db_path, 'compact']) == 0
+    assert "1 campaign days" in capsys.readouterr().out
+    assert database.load_daily_totals()['prospects_added'] == 2
+
+def test_cli_does_not_import_streamlit():
+    """The headless package must not pull in the web UI"""
+    script = "import sys, linkedin_automation.cli; print('streamlit' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Tests for the database access layer
+"""
+
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import database
+
+def test_connections_use_wal_and_busy_timeout(db):
+    """Connections are opened in WAL mode with a busy timeout"""
+    conn = database.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == database.BUSY_TIMEOUT_MS
+
+def test_connections_are_reused_per_thread(db):
+    """Each thread keeps one connection per database file"""
+    main_conn = database.get_connection()
+    assert database.get_connection(db) is main_conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(database.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main_conn
+
+def test_transaction_rolls_back_on_error(db):
+    """A failing block leaves no partial writes behind"""
+    with pytest.raises(RuntimeError):
+        with database.transaction() as c:
+            c.execute("INSERT INTO campaigns (name) VALUES ('half written')")
+            raise RuntimeError("boom")
+
+    assert len(database.load_campaign_repository()) == 0
+
+def test_campaign_and_prospect_round_trip(db, campaign_data):
+    """Saved campaigns and prospects can be loaded back"""
+    campaign_id = database.save_campaign(campaign_data)
+    prospect_id = database.save_prospect({
+        'name': 'Anjali Mehta', 'title': 'HR Manager', 'company': 'TechStartup Inc',
+        'industry': 'SaaS', 'connection_message': 'Hi Anjali',
+        'follow_up_messages': ['One', 'Two', 'Three']
+    }, campaign_id)
+
+    assert database.load_campaign(campaign_id)['name'] == 'Test Campaign'
+    prospects = database.load_prospects_page(campaign_id)
+    assert prospects['id'].tolist() == [prospect_id]
+    assert prospects.loc[0, 'status'] == 'draft'
+
+def test_concurrent_writers_do_not_lock(db, campaign_data):
+    """Writes from many threads all land without 'database is locked' errors"""
+    campaign_id = database.save_campaign(campaign_data)
+    errors = []
+
+    def write(n):
+        try:
+            for i in range(20):
+                database.save_prospect({
+                    'name': f'P{n}-{i}', 'title': 'CTO', 'company': 'Acme', 'industry': 'SaaS',
+                    'connection_message': 'Hi', 'follow_up_messages': []
+                }, campaign_id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            database.close_connections()
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert database.load_campaign_stats()[campaign_id]['total'] == 160
+
+def test_concurrent_first_open_of_a_new_database(tmp_path):
+    """Many threads opening a brand new file at once all switch it to WAL without locking errors"""
+    # The race is rare, so try a few dozen fresh files
+    for trial in range(50):
+        path = str(tmp_path / f"fresh-{trial}.db")
+        errors = []
+        start = threading.Barrier(32)
+
+        def write():
+            try:
+                start.wait()
+                with database.transaction(path) as c:
+                    c.execute("CREATE TABLE IF NOT EXISTS t (x)")
+                    c.execute("INSERT INTO t VALUES (1)")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                database.close_connections()
+
+        threads = [threading.Thread(target=write) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        conn = sqlite3.connect(path)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 32
+        conn.close()
+
+def make_row(i, **overrides):
+    row = {'name': f'Prospect {i}', 'title': 'CTO', 'company': 'Acme', 'industry': 'SaaS',
+           'profile_url': f'https://www.linkedin.com/in/prospect-{i}'}
+    row.update(overrides)
+    return row
+
+def test_bulk_import_commits_in_chunks(db, monkeypatch, campaign_data):
+    """Bulk imports write every row with one transaction per chunk"""
+    campaign_id = database.save_campaign(campaign_data)
+    transactions = []
+    real_transaction = database.transaction
+
+    def counting_transaction(*args, **kwargs):
+        transactions.append(1)
+        return real_transaction(*args, **kwargs)
+
+    monkeypatch.setattr(database, "transaction", counting_transaction)
+    written = database.save_prospects_bulk((make_row(i) for i in range(2500)), campaign_id,
+                                           chunk_size=1000)
+
+    assert written == 2500
+    assert len(transactions) == 3
+    prospects = database.load_prospects_page(campaign_id, limit=written)
+    assert len(prospects) == 2500
+    assert set(prospects['status']) == {'pending'}
+
+def test_bulk_import_upserts_on_profile_url(db, campaign_data):
+    """Re-importing a profile updates the existing row instead of duplicating it"""
+    campaign_id = database.save_campaign(campaign_data)
+    other_campaign_id = database.save_campaign(campaign_data)
+    prospect_id = database.save_prospect(make_row(1, connection_message='Hi', follow_up_messages=['A']),
+                                         campaign_id)
+
+    database.save_prospects_bulk([
+        make_row(1, title='VP Engineering', profile_url='https://www.linkedin.com/in/prospect-1/'),
+        make_row(2), make_row(2, company='Acme Corp'),
+        make_row(3, profile_url=''), make_row(3, profile_url='')
+    ], campaign_id)
+    database.save_prospects_bulk([make_row(1)], other_campaign_id)
+
+    prospects = {row['id']: row for row in database.query(
+        "SELECT * FROM prospects WHERE campaign_id = ?", (campaign_id,))}
+    assert len(prospects) == 4
+    # Existing messages and status survive an import that doesn't carry them
+    assert prospects[prospect_id]['title'] == 'VP Engineering'
+    assert prospects[prospect_id]['connection_message'] == 'Hi'
+    assert prospects[prospect_id]['status'] == 'draft'
+    assert [row['company'] for row in prospects.values() if row['name'] == 'Prospect 2'] == ['Acme Corp']
+    assert database.load_campaign_stats()[other_campaign_id]['total'] == 1
+
+    assert database.save_prospect(make_row(1, connection_message='Hello', follow_up_messages=[]),
+                                  campaign_id) == prospect_id
+
+def test_init_db_merges_existing_duplicates(monkeypatch, tmp_path, caplog):
+    """Duplicates saved before the unique index existed are merged into the newest row"""
+    path = str(tmp_path / "legacy.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    conn = sqlite3.connect(path)
+    # The tables as they were before versioning
+    database._migration_1_base_schema(conn.cursor())
+    conn.executemany("""
+        INSERT INTO prospects (campaign_id, name, profile_url, connection_message, created_date)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (1, 'old', 'https://x/in/a', 'Hi from before', '2025-01-01'),
+        (1, 'new', 'https://x/in/a', None, '2025-02-01'),
+        (1, 'no url', '', None, None), (1, 'no url', '', None, None)
+    ])
+    conn.execute("INSERT INTO messages (prospect_id, message_type, sent_date) VALUES (1, 'connection', '2025-01-02')")
+    conn.execute("INSERT INTO job_items (job_id, prospect_id, status) VALUES (1, 1, 'done')")
+    conn.commit()
+    conn.close()
+
+    try:
+        with caplog.at_level(logging.WARNING, logger=database.__name__):
+            database.init_db()
+        rows = database.query("SELECT id, name, connection_message, created_date FROM prospects ORDER BY id")
+        assert [row['name'] for row in rows] == ['new', 'no url', 'no url']
+        assert rows[0] == {'id': 2, 'name': 'new', 'connection_message': 'Hi from before',
+                           'created_date': '2025-01-01'}
+        assert database.query("SELECT prospect_id FROM messages") == [{'prospect_id': 2}]
+        assert database.query("SELECT prospect_id FROM job_items") == [{'prospect_id': 2}]
+        assert "Merged 1 duplicate prospects" in caplog.text
+    finally:
+        database.close_connections()
+
+def query_plan(sql, params=()):
+    rows = database.get_connection().execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return " ".join(row[-1] for row in rows)
+
+def test_fresh_database_is_fully_migrated(db):
+    """New databases end at the latest schema version with lookup indexes in place"""
+    conn = database.get_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+
+    assert "USING INDEX idx_prospects_campaign_status" in query_plan(
+        "SELECT * FROM prospects WHERE campaign_id = ? AND status = ?", (1, 'draft'))
+    assert "USING INDEX idx_prospects_status" in query_plan(
+        "SELECT * FROM prospects WHERE status = ?", ('pending',))
+    assert "USING INDEX idx_messages_prospect" in query_plan(
+        "SELECT * FROM messages WHERE prospect_id = ?", (1,))
+    # The id lookup after an upsert must hit the partial unique index, not a campaign scan
+    assert "INDEX idx_prospects_campaign_profile" in query_plan(
+        "SELECT id FROM prospects WHERE campaign_id = ? AND profile_url = ? AND profile_url <> ''",
+        (1, 'https://www.linkedin.com/in/a'))
+
+    # Re-running is a no-op
+    database.init_db()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+
+def test_follow_ups_are_stored_as_scheduled_messages(db, campaign_data):
+    """Follow-ups become ordered messages rows with cadence-based scheduled dates"""
+    campaign_id = database.save_campaign(campaign_data)
+    prospect_id = database.save_prospect(make_row(1, connection_message='Hi',
+                                                  follow_up_messages=['One', 'Two', 'Three']),
+                                         campaign_id)
+
+    assert database.load_follow_ups(prospect_id) == ['One', 'Two', 'Three']
+    rows = database.query("""
+        SELECT sequence_number, scheduled_date, status FROM messages
+        WHERE prospect_id = ? ORDER BY sequence_number
+    """, (prospect_id,))
+    created = datetime.fromisoformat(database.load_prospects_page(campaign_id).loc[0, 'created_date'])
+    assert [(datetime.fromisoformat(row['scheduled_date']) - created).days for row in rows] == [3, 10, 24]
+    assert {row['status'] for row in rows} == {'draft'}
+
+    # Regenerating replaces the unsent follow-ups rather than appending
+    database.save_prospect(make_row(1, connection_message='Hi again', follow_up_messages=['Uno']),
+                           campaign_id)
+    assert database.load_follow_ups(prospect_id) == ['Uno']
+
+def test_migration_moves_follow_up_json_into_messages(monkeypatch, tmp_path, caplog):
+    """Databases created before versioning get their JSON follow-ups moved into messages"""
+    path = str(tmp_path / "v0.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE prospects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, campaign_id INTEGER, name TEXT, title TEXT,
+            company TEXT, industry TEXT, profile_url TEXT, connection_message TEXT,
+            follow_up_messages TEXT, status TEXT, created_date TEXT
+        );
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, prospect_id INTEGER, message_type TEXT,
+            message_content TEXT, sent_date TEXT, response TEXT, status TEXT
+        );
+    """)
+    conn.execute("""
+        INSERT INTO prospects (campaign_id, name, profile_url, connection_message,
+                               follow_up_messages, status, created_date)
+        VALUES (1, 'Anjali', '', 'Hi', '["One", "Two", "Three"]', 'draft', '2025-01-01T09:00:00'),
+               (1, 'Ravi', '', 'Hi', 'not json', 'draft', '2025-01-01T09:00:00')
+    """)
+    conn.commit()
+    conn.close()
+
+    try:
+        with caplog.at_level(logging.WARNING, logger=database.__name__):
+            database.init_db()
+        assert database.load_follow_ups(1) == ['One', 'Two', 'Three']
+        rows = database.query("SELECT scheduled_date FROM messages ORDER BY sequence_number")
+        assert [row['scheduled_date'][:10] for row in rows] == ['2025-01-04', '2025-01-11', '2025-01-25']
+        # A blob that isn't a JSON list is reported and left where it was
+        assert database.load_follow_ups(2) == []
+        assert database.query("SELECT follow_up_messages FROM prospects ORDER BY id") == [
+            {'follow_up_messages': None}, {'follow_up_messages': 'not json'}]
+        assert "prospect 2" in caplog.text
+    finally:
+        database.close_connections()
+
+def test_campaign_stats_and_keyset_pages(db, campaign_data):
+    """Counts come from one grouped query and pages follow on from the last id"""
+    campaign_id = database.save_campaign(campaign_data)
+    other_campaign_id = database.save_campaign(campaign_data)
+    database.save_prospects_bulk([make_row(i) for i in range(7)], campaign_id)
+    database.save_prospect(make_row(100, connection_message='Hi', follow_up_messages=[]), campaign_id)
+    database.save_prospects_bulk([make_row(i) for i in range(2)], other_campaign_id)
+
+    stats = database.load_campaign_stats()
+    assert stats[campaign_id] == {'total': 8, 'pending': 7, 'draft': 1}
+    assert stats[other_campaign_id] == {'total': 2, 'pending': 2}
+
+    first = database.load_prospects_page(campaign_id, limit=5)
+    second = database.load_prospects_page(campaign_id, after_id=int(first['id'].iloc[-1]), limit=5)
+    assert len(first) == 5 and len(second) == 3
+    assert set(first['id']).isdisjoint(second['id'])
+
+    assert "INDEX idx_prospects_campaign (campaign_id=? AND rowid>?)" in query_plan(
+        "SELECT id FROM prospects WHERE campaign_id = ? AND id > ? ORDER BY id LIMIT 50", (1, 0))
+
+def test_writes_bump_data_version(db, campaign_data):
+    """Only writes to a table change its version key"""
+    campaigns_version = database.data_version('campaigns')
+    prospects_version = database.data_version('prospects')
+
+    campaign_id = database.save_campaign(campaign_data)
+    assert database.data_version('campaigns') != campaigns_version
+    assert database.data_version('prospects') == prospects_version
+
+    database.save_prospects_bulk([make_row(1)], campaign_id)
+    assert database.data_version('prospects') != prospects_version
+
+def test_writes_from_another_process_bump_data_version(db, campaign_data):
+    """A job worker in another process changes the key the app caches on"""
+    campaign_id = database.save_campaign(campaign_data)
+    version = database.data_version('jobs', 'campaigns')
+
+    subprocess.run([sys.executable, "-c", "from linkedin_automation import database; "
+                    f"database.create_job({campaign_id}, [], 4)"],
+                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                   env=dict(os.environ, LINKEDIN_AUTOMATION_DB=db), check=True)
+    assert database.data_version('jobs', 'campaigns') != version
+
+def test_campaign_repository_indexes_by_id(db, campaign_data):
+    """Campaigns resolve by id without scanning and keep newest-first order"""
+    first_id = database.save_campaign(dict(campaign_data, name='First'))
+    second_id = database.save_campaign(dict(campaign_data, name='Second'))
+
+    campaigns = database.load_campaign_repository()
+    assert len(campaigns) == 2
+    assert campaigns.ids == [second_id, first_id]
+    assert campaigns.name(first_id) == 'First'
+    assert campaigns.get(second_id)['region'] == 'India'
+    assert campaigns.get(999) is None
+    assert [campaign['name'] for campaign in campaigns.page(1, 20)] == ['First']
+
+def test_daily_stats_rollup_tracks_writes(db, campaign_data):
+    """Triggers keep the rollup in step with writes and a rebuild reproduces it"""
+    campaign_id = database.save_campaign(campaign_data)
+    database.save_prospects_bulk([make_row(i) for i in range(3)], campaign_id)
+    database.save_prospect(make_row(1, connection_message='Hi', follow_up_messages=['One']), campaign_id)
+    # Regenerating or re-importing an existing prospect isn't counted again
+    database.save_prospect(make_row(1, connection_message='Hello', follow_up_messages=['Uno']), campaign_id)
+    database.save_prospects_bulk([make_row(2)], campaign_id)
+    with database.transaction() as c:
+        c.execute("UPDATE messages SET sent_date = ?, response = 'Thanks!'", (datetime.now().isoformat(),))
+
+    expected = [{'campaign_id': campaign_id, 'day': datetime.now().date().isoformat(),
+                 'prospects_added': 3, 'messages_generated': 1, 'messages_sent': 1, 'replies': 1}]
+    assert database.load_daily_stats().to_dict('records') == expected
+
+    database.compact_daily_stats()
+    assert database.load_daily_stats(campaign_id=campaign_id).to_dict('records') == expected
+    assert len(database.load_daily_stats(since_day='2999-01-01')) == 0
+    assert database.load_daily_totals() == {'prospects_added': 3, 'messages_generated': 1, 'messages_sent': 1,
+                                            'replies': 1, 'active_campaigns': 1}
+    assert database.load_daily_totals(until_day='2000-01-01')['prospects_added'] == 0
+
+def test_token_usage_accumulates_per_campaign_and_day(db, campaign_data):
+    """Usage rows are upserted per campaign per day and summed on read"""
+    campaign_id = database.save_campaign(dict(campaign_data, token_budget=1000))
+    other_id = database.save_campaign(campaign_data)
+    database.record_token_usage(campaign_id, 100, 20)
+    database.record_token_usage(campaign_id, 50, 10)
+    database.record_token_usage(other_id, 7, 3)
+
+    assert database.load_token_usage() == {
+        campaign_id: {'input_tokens': 150, 'output_tokens': 30, 'requests': 2},
+        other_id: {'input_tokens': 7, 'output_tokens': 3, 'requests': 1}
+    }
+    assert database.campaign_tokens_used(campaign_id) == 180
+    assert database.campaign_tokens_used(999) == 0
+    assert database.get_connection().execute("SELECT COUNT(*) FROM campaign_token_usage").fetchone()[0] == 2
+    assert database.load_campaign(campaign_id)['token_budget'] == 1000
+    assert database.load_campaign(other_id)['token_budget'] is None
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for near-duplicate detection of connection messages
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import database
+from linkedin_automation.dedupe import find_campaign_duplicates, near_duplicate_groups, tokenize
+
+TEMPLATE = ("Hi {name}, I enjoyed reading about the work {company} is doing on hybrid teams "
+            "and would love to connect and swap notes on what has been working for you.")
+WORDS = ("growth hiring product platform culture remote engineering data scale insight "
+         "onboarding leaders startup payroll analytics retention customers launch pricing").split()
+
+def random_message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(30))
+
+def test_tokenize_masks_name_and_company():
+    assert tokenize("Hi Priya, congrats to ScaleUp Inc!", "Priya Sharma", "ScaleUp Inc") == \
+        ['hi', '<name>', 'congrats', 'to', '<company>', '<company>']
+
+def test_template_messages_are_grouped_and_distinct_ones_are_not():
+    """Copies differing only in name and company (plus a word) group; unrelated messages don't"""
+    rng = random.Random(0)
+    documents, expected = [], []
+    for i in range(200):
+        if i % 20 == 0:
+            expected.append(i)
+            text = TEMPLATE.format(name=f"Person{i}", company=f"Company{i} Labs")
+            if i % 40 == 0:
+                text = text.replace("love", "like")
+        else:
+            text = random_message(rng)
+        documents.append(tokenize(text, f"Person{i} Smith", f"Company{i} Labs"))
+
+    assert near_duplicate_groups(documents) == [expected]
+    assert near_duplicate_groups(documents[1:20]) == []
+
+def test_find_campaign_duplicates_keeps_sent_message_and_regenerates_the_rest(db, campaign_data):
+    campaign_id = database.save_campaign(campaign_data)
+    rows = [{'name': f'Prospect {i}', 'title': 'CTO', 'company': f'Company {i}', 'industry': 'SaaS',
+             'profile_url': f'https://www.linkedin.com/in/p{i}',
+             'connection_message': TEMPLATE.format(name='Prospect', company=f'Company {i}')}
+            for i in range(4)]
+    rows.append({'name': 'Other', 'title': 'CTO', 'company': 'Elsewhere', 'industry': 'SaaS',
+                 'profile_url': 'https://www.linkedin.com/in/other',
+                 'connection_message': random_message(random.Random(1))})
+    database.save_prospects_bulk(rows, campaign_id)
+    ids = [row['id'] for row in database.query("SELECT id FROM prospects ORDER BY id")]
+    with database.transaction() as c:
+        c.execute("UPDATE prospects SET status = 'sent' WHERE id = ?", (ids[2],))
+
+    report = find_campaign_duplicates(campaign_id)
+
+    assert report.checked == 5
+    [group] = report.groups
+    assert [prospect['id'] for prospect in group] == [ids[2], ids[0], ids[1], ids[3]]
+    assert report.flagged == [ids[0], ids[1], ids[3]]
+
+    job_id = database.queue_regeneration(campaign_id, report.flagged + [ids[2]], max_concurrency=2)
+    job = database.load_job(job_id)
+    assert job['total'] == 3 and job['bypass_cache'] == 1
+    statuses = {row['id']: row['status'] for row in database.query("SELECT id, status FROM prospects")}
+    assert [statuses[i] for i in ids] == ['queued', 'queued', 'sent', 'queued', 'draft']
+
+    # Nothing left to regenerate once they are queued
+    assert database.queue_regeneration(campaign_id, report.flagged, max_concurrency=2) is None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming campaign exports
+"""
+
+import csv
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import cli, database
+from linkedin_automation.export import export_campaign, iter_campaign_rows
+
+@pytest.fixture
+def campaign_id(db, campaign_data):
+    campaign_id = database.save_campaign(campaign_data)
+    other_campaign = database.save_campaign(dict(campaign_data, name='Other'))
+    rows = [{'name': f'Prospect {i}', 'title': 'CTO', 'company': f'Company {i}', 'industry': 'SaaS',
+             'profile_url': f'https://www.linkedin.com/in/p{i}',
+             'connection_message': f'Hi Prospect {i}, "quoted", with a comma' if i % 2 == 0 else None,
+             'follow_up_messages': ['First', 'Second', 'Third'] if i % 2 == 0 else []}
+            for i in range(25)]
+    database.save_prospects_bulk(rows, campaign_id)
+    database.save_prospects_bulk(rows[:3], other_campaign)
+    return campaign_id
+
+def test_rows_are_streamed_in_chunks(campaign_id):
+    chunks = list(iter_campaign_rows(campaign_id, ['name', 'follow_up_2'], chunk_size=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert chunks[0][:2] == [('Prospect 0', 'Second'), ('Prospect 1', None)]
+
+def test_csv_export_round_trips(campaign_id):
+    output = io.BytesIO()
+    assert export_campaign(campaign_id, output, 'csv', chunk_size=7) == 25
+    reader = list(csv.DictReader(io.StringIO(output.getvalue().decode('utf-8'))))
+    assert len(reader) == 25
+    assert reader[0]['connection_message'] == 'Hi Prospect 0, "quoted", with a comma'
+    assert reader[0]['follow_up_3'] == 'Third'
+    assert reader[1]['status'] == 'pending' and reader[1]['connection_message'] == ''
+
+def test_parquet_export_selects_columns(campaign_id, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "export.parquet")
+    assert export_campaign(campaign_id, path, 'parquet', ['id', 'name', 'follow_up_1_scheduled'],
+                           chunk_size=10) == 25
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.column_names == ['id', 'name', 'follow_up_1_scheduled']
+    assert table.column('name')[24].as_py() == 'Prospect 24'
+    assert table.column('follow_up_1_scheduled')[0].as_py() is not None
+    assert table.column('follow_up_1_scheduled')[1].as_py() is None
+
+def test_unknown_columns_are_rejected(campaign_id):
+    with pytest.raises(ValueError, match="password"):
+        export_campaign(campaign_id, io.BytesIO(), 'csv', ['name', 'password'])
+
+def test_cli_export(campaign_id, tmp_path, capsys):
+    path = str(tmp_path / "out.csv")
+    assert cli.main(['--db', database.DB_PATH, 'export', '--campaign', str(campaign_id),
+                     '--output', path, '--columns', 'name,status']) == 0
+    assert "Exported 25 prospects" in capsys.readouterr().out
+    with open(path, newline='') as file:
+        assert next(csv.reader(file)) == ['name', 'status']
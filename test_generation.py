@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+"""
+Tests for message generation: the client, cache, batching, streaming, routing and job worker
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conftest import ApiError, FakeModel, FakeResponse, FlakyModel, NamedModel, PrefixAwareModel, \
+    ScriptedModel, StreamingModel
+from linkedin_automation import database, generation
+from linkedin_automation.metrics import metrics
+
+def make_prospects(count):
+    return [
+        generation.Prospect(name=f"Prospect {i}", title="CTO", company="Acme",
+                     industry="SaaS", profile_summary="Builds things")
+        for i in range(count)
+    ]
+
+CAMPAIGN_DATA = {
+    'product_description': 'HR automation',
+    'target_industry': 'SaaS',
+    'outreach_goal': 'Book a demo',
+    'brand_voice': 'Friendly'
+}
+
+def test_generate_many_preserves_order(make_generator):
+    """Bulk generation returns results in input order and reports progress"""
+    fake = FakeModel(delay=0.01)
+    generator = make_generator(fake)
+
+    prospects = make_prospects(25)
+    progress = []
+    results = generator.generate_many(
+        prospects, CAMPAIGN_DATA, max_concurrency=8,
+        progress_callback=lambda done, total: progress.append((done, total))
+    )
+
+    assert results == [f"Hi Prospect {i}" for i in range(25)]
+    assert progress == [(i, 25) for i in range(1, 26)]
+    assert fake.calls == 25
+
+def test_iter_generate_bounds_in_flight_requests(make_generator):
+    """No more than max_concurrency requests run at the same time"""
+    state = {"active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class TrackingModel(FakeModel):
+        def generate_content(self, prompt, **kwargs):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            try:
+                return super().generate_content(prompt, **kwargs)
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+    generator = make_generator(TrackingModel(delay=0.01))
+    pairs = list(generator.iter_generate(
+        make_prospects(20), CAMPAIGN_DATA, max_concurrency=3))
+
+    assert sorted(index for index, _ in pairs) == list(range(20))
+    assert state["peak"] <= 3
+
+def test_response_cache_hits_and_bypass(tmp_path, make_generator):
+    """Identical prompts are served from the cache unless bypassed"""
+    fake = FakeModel()
+    cache = generation.ResponseCache(str(tmp_path / "cache.db"))
+    generator = make_generator(fake, cache=cache)
+    prospect = make_prospects(1)[0]
+
+    first = generator.generate_connection_message(prospect, CAMPAIGN_DATA)
+    second = generator.generate_connection_message(prospect, CAMPAIGN_DATA)
+    assert first == second == "Hi Prospect 0"
+    assert fake.calls == 1
+
+    generator.generate_connection_message(prospect, CAMPAIGN_DATA, use_cache=False)
+    assert fake.calls == 2
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+def test_response_cache_ttl_and_lru_eviction(monkeypatch, tmp_path):
+    """Expired entries miss and the least recently used entries are evicted"""
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(generation.time, "time", lambda: clock["now"])
+
+    cache = generation.ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60, max_entries=2)
+    cache.set("a", "A")
+    clock["now"] += 1
+    cache.set("b", "B")
+    clock["now"] += 1
+    assert cache.get("a") == "A"  # "a" is now more recently used than "b"
+
+    clock["now"] += 1
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+
+    clock["now"] += 120
+    assert cache.get("c") is None
+    assert cache.stats()['entries'] == 1
+
+    key = generation.ResponseCache.make_key("m", "prompt", {"temperature": 0.2})
+    assert key == generation.ResponseCache.make_key("m", "prompt", {"temperature": 0.2})
+    assert key != generation.ResponseCache.make_key("m", "prompt", {"temperature": 0.9})
+
+def test_generate_messages_single_call(make_generator):
+    """Combined generation returns the note and follow-ups from one JSON reply"""
+    payload = {"connection_message": "Hi there", "follow_ups": ["One", "Two", "Three"]}
+    fake = ScriptedModel(lambda prompt, kwargs: "```json\n" + json.dumps(payload) + "\n```")
+
+    generator = make_generator(fake)
+    connection_msg, follow_ups = generator.generate_messages(make_prospects(1)[0], CAMPAIGN_DATA)
+
+    assert connection_msg == "Hi there"
+    assert follow_ups == ["One", "Two", "Three"]
+    assert fake.calls == 1
+
+def test_generate_messages_falls_back_on_bad_json(make_generator):
+    """A reply that fails schema validation falls back to the two-call path"""
+
+    def reply(prompt, kwargs):
+        if kwargs.get("generation_config"):
+            return json.dumps({"connection_message": "Hi", "follow_ups": ["only one"]})
+        if "Generate 3 follow-up" in prompt:
+            return "FOLLOW-UP 1:\nA\n\nFOLLOW-UP 2:\nB\n\nFOLLOW-UP 3:\nC"
+        return "Plain note"
+
+    fake = ScriptedModel(reply)
+
+    generator = make_generator(fake)
+    connection_msg, follow_ups = generator.generate_messages(make_prospects(1)[0], CAMPAIGN_DATA)
+
+    assert connection_msg == "Plain note"
+    assert follow_ups == ["A", "B", "C"]
+    assert fake.calls == 3
+
+    # The malformed reply isn't cached: a retry asks for the combined reply again
+    generator.generate_messages(make_prospects(1)[0], CAMPAIGN_DATA)
+    assert fake.calls == 4
+
+def batch_reply(skip=()):
+    """Answer batch prompts with a JSON array, leaving out the ids in skip"""
+    def reply(prompt, kwargs):
+        if "[id: " not in prompt:
+            return "Hi " + prompt.split("- Name: ")[1].split("\n")[0]
+        items = []
+        for block in prompt.split("[id: ")[1:]:
+            prospect_id = block.split("]")[0]
+            name = block.split("- Name: ")[1].split("\n")[0]
+            if prospect_id not in skip:
+                items.append({"id": prospect_id, "connection_message": f"Hi {name}"})
+        return json.dumps(items)
+    return reply
+
+def test_generate_batched_retries_missing_items(make_generator):
+    """Batched generation splits results back out and retries missing ids alone"""
+    fake = ScriptedModel(batch_reply(skip={"3"}))
+
+    generator = make_generator(fake)
+    prospects = make_prospects(12)
+    assert generator.plan_batches(prospects, CAMPAIGN_DATA, max_batch_size=5) == [
+        [0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11]]
+
+    results = generator.generate_batched(prospects, CAMPAIGN_DATA, max_batch_size=5)
+
+    assert results == [f"Hi Prospect {i}" for i in range(12)]
+    # Three batch requests plus one individual retry for id 3
+    assert fake.calls == 4
+    assert sum(prompt.count("Campaign Context:") for prompt in fake.prompts) == 4
+
+def test_generate_batched_splits_unparseable_batches(make_generator):
+    """A truncated batch reply is retried as two smaller batches"""
+    answer = batch_reply()
+
+    def reply(prompt, kwargs):
+        text = answer(prompt, kwargs)
+        # Simulate the model running out of output tokens on big batches
+        return text[:-10] if prompt.count("[id: ") > 2 else text
+
+    fake = ScriptedModel(reply)
+
+    generator = make_generator(fake)
+    results = generator.generate_batched(make_prospects(4), CAMPAIGN_DATA, max_batch_size=4)
+
+    assert results == [f"Hi Prospect {i}" for i in range(4)]
+    assert fake.calls == 3
+
+    # The truncated reply isn't cached: a retry sends the full batch to the model again
+    generator.generate_batched(make_prospects(4), CAMPAIGN_DATA, max_batch_size=4)
+    assert fake.calls == 4
+
+def test_client_retries_transient_errors(make_generator):
+    """429/503 responses are retried with backoff and slow the token bucket down"""
+    fake = FlakyModel([ApiError(429), ApiError(503)])
+    generator = make_generator(fake)
+    delays = []
+    generator.client.sleep = delays.append
+
+    message = generator.generate_connection_message(make_prospects(1)[0], CAMPAIGN_DATA)
+
+    assert message == "Hi Prospect 0"
+    assert fake.calls == 3
+    assert len(delays) == 2
+    assert all(0 <= delay <= generation.RETRY_MAX_DELAY for delay in delays)
+    assert generator.client.limiter.rate < generator.client.limiter.max_rate
+
+def test_client_raises_typed_errors(make_generator):
+    """Exhausted retries and non-retryable failures raise GenerationError subclasses"""
+    prospect = make_prospects(1)[0]
+
+    generator = make_generator(FlakyModel([ApiError(429)] * 3), max_retries=2)
+    with pytest.raises(generation.RateLimitError):
+        generator.generate_connection_message(prospect, CAMPAIGN_DATA)
+
+    generator = make_generator(FlakyModel([ApiError(400)]))
+    with pytest.raises(generation.GenerationError):
+        generator.generate_connection_message(prospect, CAMPAIGN_DATA)
+    assert generator.cache.stats()['entries'] == 0
+
+def test_circuit_breaker_short_circuits_bulk_runs(make_generator):
+    """Once the breaker opens, remaining prospects fail fast without API calls"""
+    fake = FlakyModel([ApiError(503)] * 100)
+    breaker = generation.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    generator = make_generator(fake, max_retries=1, breaker=breaker)
+
+    results = generator.generate_many(make_prospects(10), CAMPAIGN_DATA,
+                                      max_concurrency=1, return_exceptions=True)
+
+    assert all(isinstance(result, generation.GenerationError) for result in results)
+    assert any(isinstance(result, generation.CircuitOpenError) for result in results)
+    assert fake.calls == 3
+    with pytest.raises(generation.GenerationError):
+        generator.generate_many(make_prospects(2), CAMPAIGN_DATA)
+
+def test_circuit_breaker_half_open_trial_always_records_an_outcome(make_generator):
+    """A half-open trial that gets a 4xx or an interrupted stream doesn't leave the breaker stuck"""
+    prospect = make_prospects(1)[0]
+    breaker = generation.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    generator = make_generator(FlakyModel([ApiError(400)]), breaker=breaker)
+
+    breaker.record_failure()
+    with pytest.raises(generation.GenerationError):
+        generator.generate_connection_message(prospect, CAMPAIGN_DATA)
+    # A 400 means the API is reachable
+    assert breaker.state == 'closed'
+    assert generator.generate_connection_message(prospect, CAMPAIGN_DATA) == "Hi Prospect 0"
+
+    class BrokenStream(StreamingModel):
+        def generate_content(self, prompt, stream=False, **kwargs):
+            yield FakeResponse("Hi ")
+            raise ApiError(503)
+
+    streaming = make_generator(BrokenStream(), breaker=breaker)
+    breaker.record_failure()
+    with pytest.raises(generation.GenerationError, match="interrupted"):
+        list(streaming.client.stream_text(streaming._connection_prompt(prospect)))
+    # Reopened with a fresh cool-down, so the next call gets another trial
+    assert breaker.state == 'open'
+    assert generator.generate_connection_message(prospect, CAMPAIGN_DATA, use_cache=False) == "Hi Prospect 0"
+    assert breaker.state == 'closed'
+
+def test_token_bucket_limits_request_rate(monkeypatch):
+    """The bucket hands out its burst capacity, then paces requests"""
+    clock = {"now": 0.0}
+    monkeypatch.setattr(generation.time, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(generation.time, "sleep", lambda seconds: clock.update(now=clock["now"] + seconds))
+
+    bucket = generation.TokenBucket(requests_per_minute=60, capacity=2)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock["now"] == pytest.approx(3.0)
+
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(0.5)
+    bucket.recover()
+    assert bucket.rate == pytest.approx(0.55)
+
+def combined_reply(prompt, kwargs):
+    name = prompt.split("- Name: ")[1].split("\n")[0]
+    return json.dumps({"connection_message": f"Hi {name}",
+                       "follow_ups": ["One", "Two", "Three"]})
+
+def queue_job(campaign_data, count):
+    campaign_id = database.save_campaign(campaign_data)
+    job_id = database.create_job(campaign_id, [
+        {"name": f"Prospect {i}", "title": "CTO", "company": "Acme",
+         "industry": "SaaS", "profile_summary": "Builds things"}
+        for i in range(count)
+    ], max_concurrency=2)
+    return campaign_id, job_id
+
+def saved_prospect_names(campaign_id):
+    rows = database.query("SELECT name, connection_message FROM prospects WHERE campaign_id = ?",
+                          (campaign_id,))
+    return sorted((row['name'], row['connection_message']) for row in rows)
+
+def test_job_worker_processes_queue(db, campaign_data, make_generator):
+    """The worker generates every queued prospect and saves it to the campaign"""
+    campaign_id, job_id = queue_job(campaign_data, 5)
+    fake = ScriptedModel(combined_reply)
+
+    worker = generation.JobWorker(make_generator(fake))
+    assert worker.run_once()
+    assert not worker.run_once()
+
+    jobs = database.load_jobs()
+    assert jobs.loc[0, "status"] == "completed"
+    assert jobs.loc[0, "completed"] == 5
+    assert saved_prospect_names(campaign_id) == [(f"Prospect {i}", f"Hi Prospect {i}") for i in range(5)]
+    assert fake.calls == 5
+
+def test_job_worker_resumes_without_regenerating(db, campaign_data, make_generator):
+    """A job left running by a crashed worker resumes from its pending items"""
+    campaign_id, job_id = queue_job(campaign_data, 5)
+
+    # Simulate a worker that finished two items and then died
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE job_items SET status = 'done' WHERE id IN "
+                 "(SELECT id FROM job_items WHERE job_id = ? ORDER BY id LIMIT 2)", (job_id,))
+    conn.execute("UPDATE jobs SET status = 'running', completed = 2, updated_date = '2000-01-01' "
+                 "WHERE id = ?", (job_id,))
+    conn.commit()
+    conn.close()
+
+    fake = ScriptedModel(combined_reply)
+    assert generation.JobWorker(make_generator(fake)).run_once()
+
+    assert fake.calls == 3
+    assert database.load_jobs().loc[0, "completed"] == 5
+    assert [name for name, _ in saved_prospect_names(campaign_id)] == [
+        "Prospect 2", "Prospect 3", "Prospect 4"]
+
+def test_job_worker_pauses_when_api_is_down(db, campaign_data, make_generator):
+    """Items stay pending when the circuit breaker is open"""
+    campaign_id, job_id = queue_job(campaign_data, 3)
+    breaker = generation.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+
+    worker = generation.JobWorker(make_generator(FakeModel(), breaker=breaker), poll_interval=0)
+    assert worker.run_once()
+
+    jobs = database.load_jobs()
+    assert (jobs.loc[0, "status"], jobs.loc[0, "completed"], jobs.loc[0, "failed"]) == ("pending", 0, 0)
+    assert len(database.load_pending_job_items(job_id)) == 3
+
+def test_campaign_prefix_is_sent_as_system_instruction(make_generator):
+    """The campaign block is built once and sent separately from the per-prospect prompt"""
+    fake = PrefixAwareModel()
+    generator = make_generator(fake)
+
+    generator.generate_many(make_prospects(3), CAMPAIGN_DATA)
+
+    instructions = {instruction for instruction, _ in fake.requests}
+    assert instructions == {generation.campaign_prefix(CAMPAIGN_DATA)}
+    assert "Product/Service: HR automation" in instructions.pop()
+    assert all("HR automation" not in prompt and "- Name: Prospect" in prompt for _, prompt in fake.requests)
+    assert len(generator.client._prefixed_models) == 1
+
+def test_prefixed_models_expire_and_old_sdks_fall_back_to_the_prompt(monkeypatch, make_generator):
+    """Expired cached-content variants are rebuilt; an SDK without system instructions gets the prefix inline"""
+    clock = {"now": 0.0}
+    monkeypatch.setattr(generation.time, "monotonic", lambda: clock["now"])
+    fake = PrefixAwareModel()
+    variants = []
+    real_variant = fake.with_system_instruction
+
+    def expiring_variant(system_instruction):
+        variant = real_variant(system_instruction)
+        variant.expires_at = clock["now"] + 60
+        variants.append(variant)
+        return variant
+
+    fake.with_system_instruction = expiring_variant
+    generator = make_generator(fake)
+    generator.generate_many(make_prospects(2), CAMPAIGN_DATA, use_cache=False)
+    clock["now"] = 61
+    generator.generate_many(make_prospects(2), CAMPAIGN_DATA, use_cache=False)
+    assert len(variants) == 2
+    assert list(generator.client._prefixed_models.values()) == [variants[1]]
+
+    def old_sdk(system_instruction):
+        raise TypeError("__init__() got an unexpected keyword argument 'system_instruction'")
+
+    fake = ScriptedModel(lambda prompt, kwargs: "Hi")
+    fake.with_system_instruction = old_sdk
+    generator = make_generator(fake)
+    assert generator.generate_many(make_prospects(3), CAMPAIGN_DATA, use_cache=False) == ["Hi"] * 3
+    assert all(prompt.count("Product/Service: HR automation") == 1 for prompt in fake.prompts)
+
+def test_token_usage_is_booked_per_campaign_and_capped(db, campaign_data, make_generator):
+    """Model tokens are recorded against the campaign; a spent budget stops its job"""
+    campaign_id, job_id = queue_job(campaign_data, 3)
+    generator = make_generator(ScriptedModel(combined_reply))
+
+    campaign = database.load_campaign(campaign_id)
+    generator.generate_connection_message(make_prospects(1)[0], campaign, use_cache=False)
+    usage = database.load_token_usage()[campaign_id]
+    assert usage['requests'] == 1 and usage['input_tokens'] > 0 and usage['output_tokens'] > 0
+
+    database.set_campaign_token_budget(campaign_id, database.campaign_tokens_used(campaign_id))
+    with pytest.raises(generation.BudgetExceededError):
+        generator.generate_connection_message(make_prospects(1)[0], database.load_campaign(campaign_id),
+                                              use_cache=False)
+
+    assert generation.JobWorker(generator).run_job(job_id) == 'over_budget'
+    assert database.load_job(job_id)['status'] == 'over_budget'
+    assert len(database.load_pending_job_items(job_id)) == 3
+    assert database.claim_next_job() is None
+
+    # Raising the cap puts the job back in the queue
+    database.set_campaign_token_budget(campaign_id, None)
+    assert generation.JobWorker(generator).run_job(job_id) == 'completed'
+    assert database.load_token_usage()[campaign_id]['requests'] == 4
+
+def test_job_worker_generates_imported_prospects(db, campaign_data, make_generator):
+    """Imported prospects are queued once and updated in place by the worker"""
+    campaign_id, _ = queue_job(campaign_data, 0)
+    database.save_prospects_bulk([
+        {"name": f"Imported {i}", "title": "CTO", "company": "Acme", "industry": "SaaS",
+         "profile_url": f"https://www.linkedin.com/in/imported-{i}", "profile_summary": "Builds things"}
+        for i in range(3)
+    ], campaign_id)
+
+    job_id = database.queue_pending_prospects(campaign_id, max_concurrency=2)
+    assert database.queue_pending_prospects(campaign_id, max_concurrency=2) is None
+
+    fake = ScriptedModel(combined_reply)
+    worker = generation.JobWorker(make_generator(fake))
+    while worker.run_once():
+        pass
+
+    assert all("Builds things" in prompt for prompt in fake.prompts)
+    assert saved_prospect_names(campaign_id) == [(f"Imported {i}", f"Hi Imported {i}") for i in range(3)]
+    statuses = {row for row in database.load_jobs().loc[:, ["id", "status"]].itertuples(index=False)}
+    assert (job_id, "completed") in statuses
+
+FOLLOW_UP_VARIANTS = [
+    "FOLLOW-UP 1:\nOne\n\nFOLLOW-UP 2:\nTwo\n\nFOLLOW-UP 3:\nThree",
+    "Here is the sequence:\n\n**FOLLOW-UP 1:**\nOne\n\n---\n\n**FOLLOW-UP 2:**\nTwo\n\n**FOLLOW-UP 3:**\nThree\n",
+    "### Follow-up #1\nOne\n### Follow-up #2\nTwo\n### Follow-up #3\nThree",
+    "Follow-up 1 (2-3 days after connection): One\nFollow up 2: Two\nfollow-up 3 - Three",
+    "1. Follow-Up Message 1: One\n2. Follow-Up Message 2: Two\n3. Follow-Up Message 3: Three",
+    "FOLLOW-UP 1: One FOLLOW-UP 2: Two FOLLOW-UP 3: Three",
+    '{"follow_ups": ["One", "Two", "Three"]}',
+]
+
+def test_follow_up_parser_tolerates_header_variants():
+    """Header case, markdown and numbering variants all split into the three messages"""
+    for text in FOLLOW_UP_VARIANTS:
+        assert generation.parse_follow_ups(text) == ["One", "Two", "Three"], text
+
+    # Prose mentioning a follow-up is not a header
+    text = "FOLLOW-UP 1:\nI'll follow up 2 weeks later.\nFOLLOW-UP 2:\nTwo\nFOLLOW-UP 3:\nThree"
+    assert generation.parse_follow_ups(text)[0] == "I'll follow up 2 weeks later."
+
+    for text, reason in [("Thanks for connecting!", "no follow-up headers found"),
+                         ("FOLLOW-UP 1: One\nFOLLOW-UP 2: Two", "found 2 follow-ups, expected 3"),
+                         ("FOLLOW-UP 1: One\nFOLLOW-UP 2:\nFOLLOW-UP 3: Three", "follow-up 2 is empty")]:
+        with pytest.raises(generation.FollowUpParseError) as error:
+            generation.parse_follow_ups(text)
+        assert error.value.reason == reason
+        assert error.value.text == text
+
+def test_follow_up_parse_failure_reprompts_only_that_prospect(make_generator):
+    """A malformed reply re-prompts that prospect once and is never returned as a message"""
+
+    def reply(prompt, kwargs):
+        if "Prospect 2" in prompt:
+            return "Sorry, I can't help with that."
+        if "Prospect 1" in prompt and "could not be used" not in prompt:
+            return "Happy to help! Here are three messages for you."
+        return "FOLLOW-UP 1:\nOne\nFOLLOW-UP 2:\nTwo\nFOLLOW-UP 3:\nThree"
+
+    fake = ScriptedModel(reply)
+    generator = make_generator(fake)
+    prospects = make_prospects(3)
+
+    assert generator.generate_follow_up_sequence(prospects[0], CAMPAIGN_DATA) == ["One", "Two", "Three"]
+    assert generator.generate_follow_up_sequence(prospects[1], CAMPAIGN_DATA) == ["One", "Two", "Three"]
+    with pytest.raises(generation.FollowUpParseError):
+        generator.generate_follow_up_sequence(prospects[2], CAMPAIGN_DATA)
+    assert [sum("Prospect %d" % i in prompt for prompt in fake.prompts) for i in range(3)] == [1, 2, 2]
+
+    # The malformed reply was dropped from the cache; the good retry is served from it
+    assert generator.generate_follow_up_sequence(prospects[1], CAMPAIGN_DATA) == ["One", "Two", "Three"]
+    assert sum("Prospect 1" in prompt for prompt in fake.prompts) == 3
+
+def test_stream_messages_streams_both_parts(make_generator):
+    """Connection note and follow-ups arrive as chunks and are cached once complete"""
+    fake = StreamingModel()
+    generator = make_generator(fake)
+    prospect = make_prospects(1)[0]
+
+    chunks = list(generator.stream_messages(prospect, CAMPAIGN_DATA))
+    texts = {}
+    for part, chunk in chunks:
+        texts[part] = texts.get(part, "") + chunk
+
+    assert len(chunks) > 2
+    assert texts["connection_message"].strip() == "Hi Prospect 0, great to meet you"
+    assert generation.parse_follow_ups(texts["follow_ups"]) == ["One", "Two", "Three"]
+    assert fake.calls == 2
+
+    # The streamed text is cached under the same key as a non-streamed call
+    assert generator.generate_connection_message(prospect, CAMPAIGN_DATA) == \
+        "Hi Prospect 0, great to meet you"
+    assert fake.calls == 2
+
+def test_stream_text_retries_before_first_chunk(make_generator):
+    """Transient errors before any text is yielded are retried"""
+    generator = make_generator(StreamingModel(errors=[ApiError(503)]))
+    prospect = make_prospects(1)[0]
+
+    text = "".join(generator.client.stream_text(generator._connection_prompt(prospect)))
+    assert text.strip() == "Hi Prospect 0, great to meet you"
+
+    failing = make_generator(StreamingModel(errors=[ApiError(400)]))
+    with pytest.raises(generation.GenerationError):
+        list(failing.stream_messages(prospect, CAMPAIGN_DATA, use_cache=False))
+
+def test_stream_messages_returns_without_waiting_for_the_other_stream(make_generator):
+    """Stopping early doesn't block until the slower stream's next chunk arrives"""
+    release = threading.Event()
+
+    class SlowFollowUps(StreamingModel):
+        def generate_content(self, prompt, stream=False, **kwargs):
+            response = super().generate_content(prompt, stream=stream, **kwargs)
+            if "follow-up messages" not in prompt:
+                return response
+
+            def chunks():
+                for chunk in response:
+                    release.wait(5)
+                    yield chunk
+            return chunks()
+
+    generator = make_generator(SlowFollowUps())
+    stream = generator.stream_messages(make_prospects(1)[0], CAMPAIGN_DATA, use_cache=False)
+
+    assert next(stream)[0] == "connection_message"
+    started = time.perf_counter()
+    stream.close()
+    assert time.perf_counter() - started < 1
+    release.set()
+
+def test_fake_backend_is_deterministic(make_generator):
+    """The offline backend answers every prompt format and fails reproducibly per seed"""
+    from linkedin_automation.model_backends import FakeBackend
+
+    def run(seed):
+        backend = FakeBackend(latency=0, error_rate=0.3, seed=seed)
+        generator = make_generator(backend, max_retries=0)
+        prospects = make_prospects(20)
+        # Failures are drawn in call order, so the same prospects only fail when calls go out in order
+        return generator.generate_many(prospects, CAMPAIGN_DATA, max_concurrency=1, use_cache=False,
+                                       return_exceptions=True)
+
+    first, second = run(seed=1), run(seed=1)
+    failures = [isinstance(result, generation.GenerationError) for result in first]
+    assert failures == [isinstance(result, generation.GenerationError) for result in second]
+    assert 0 < sum(failures) < 20
+
+    generator = make_generator(FakeBackend(latency=0))
+    prospects = make_prospects(3)
+    connection_message, follow_ups = generator.generate_messages(prospects[0], CAMPAIGN_DATA)
+    assert "Prospect 0" in connection_message and len(follow_ups) == 3
+    assert len(generator.generate_follow_up_sequence(prospects[0], CAMPAIGN_DATA)) == 3
+    assert all("Prospect" in message
+               for message in generator.generate_batched(prospects, CAMPAIGN_DATA))
+    streamed = "".join(chunk for _, chunk in generator.stream_messages(prospects[1], CAMPAIGN_DATA))
+    assert "Prospect 1" in streamed
+
+def test_backends_must_implement_generate_content():
+    """A backend missing generate_content fails when it's created, not on its first call"""
+    from linkedin_automation.model_backends import ModelBackend
+
+    class Incomplete(ModelBackend):
+        model_name = 'models/incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_gemini_client_is_created_on_first_use(monkeypatch):
+    """The shared client is built once, from the backend configured at first use"""
+    from linkedin_automation import config
+    from linkedin_automation.model_backends import FakeBackend
+
+    monkeypatch.setattr(generation, "gemini_client", None)
+    monkeypatch.setattr(config, "MODEL_BACKEND", "fake")
+    generator = generation.MessageGenerator("key")
+    assert generation.gemini_client is None
+
+    assert generator.client is generation.get_gemini_client()
+    assert isinstance(generator.client.model, FakeBackend)
+
+def test_model_calls_are_instrumented(make_generator):
+    """Latency, tokens and retries of model calls are recorded"""
+    metrics.reset()
+    generator = make_generator(FlakyModel([ApiError(503)]))
+
+    generator.generate_connection_message(make_prospects(1)[0], CAMPAIGN_DATA, use_cache=False)
+
+    counters = {(row["metric"], row["labels"]): row["value"] for row in metrics.counter_rows()}
+    assert counters[("model_retries_total", '{model="models/fake"}')] == 1
+    assert counters[("model_response_tokens_total", '{model="models/fake"}')] > 0
+    outcomes = metrics.recent_samples("model_request_seconds")
+    assert len(outcomes['{mode="sync",model="models/fake",outcome="error"}']) == 1
+    assert len(outcomes['{mode="sync",model="models/fake",outcome="ok"}']) == 1
+
+def make_router(primary_model, fallback_model, **router_options):
+    clients = []
+    for model in (primary_model, fallback_model):
+        client = generation.GeminiClient(model, requests_per_minute=600000)
+        client.sleep = lambda seconds: None
+        clients.append(client)
+    return generation.ModelRouter(*clients, **router_options)
+
+def test_router_hedges_slow_requests_and_cancels_the_loser():
+    """A request still waiting after the hedge delay goes to the fallback too; the loser is cancelled"""
+    primary, fallback = NamedModel("models/primary"), NamedModel("models/fallback")
+    router = make_router(primary, fallback, initial_hedge_delay=0.05)
+    # The primary's rate limiter is empty, so its request waits about a second
+    router.primary.limiter = generation.TokenBucket(60, capacity=1)
+    router.primary.limiter.tokens = 0
+    generation.metrics.reset()
+
+    started = time.perf_counter()
+    assert router.generate_text("Hi") == "models/fallback reply"
+    assert time.perf_counter() - started < 0.5
+
+    router._executor.shutdown(wait=True)
+    assert primary.calls == 0 and fallback.calls == 1
+    counters = {(row["metric"], row["labels"]): row["value"] for row in generation.metrics.counter_rows()}
+    assert counters[("model_hedges_total", '{model="models/fallback"}')] == 1
+    assert counters[("model_hedge_wins_total", '{model="models/fallback"}')] == 1
+
+def test_router_falls_back_on_errors_and_routes_around_a_failing_primary():
+    """Failures are retried on the fallback at once; a mostly failing primary stops being tried first"""
+    primary = NamedModel("models/primary", errors=[ApiError(400)] * 5)
+    fallback = NamedModel("models/fallback")
+    router = make_router(primary, fallback)
+
+    assert [router.generate_text(f"Hi {i}") for i in range(3)] == ["models/fallback reply"] * 3
+    assert [row['model'] for row in router.routing_stats()] == ["models/fallback", "models/primary"]
+    assert router.routing_stats()[1]['error_rate'] == 1.0
+
+    # Both failing raises the error from the model tried first
+    router.fallback.model.errors = [ApiError(400)] * 2
+    with pytest.raises(generation.GenerationError):
+        router.generate_text("Hi again")
+
+    # The hedge delay follows the model's recent p95 once there are enough samples
+    stats = generation.ModelStats()
+    for i in range(1, 101):
+        stats.record(True, i / 100)
+    router.stats["models/primary"] = stats
+    assert router.hedge_delay(router.primary) == pytest.approx(0.96)
+
+def test_cancelled_requests_leave_a_recovering_breaker_open_and_untried():
+    """A hedge cancelled in the rate limiter doesn't claim the half-open trial; half-open primaries go second"""
+    client = generation.GeminiClient(NamedModel("models/primary"), requests_per_minute=60,
+                                     breaker=generation.CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    client.limiter = generation.TokenBucket(60, capacity=1)
+    client.limiter.tokens = 0
+    client.breaker.record_failure()
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+    with pytest.raises(generation.RequestCancelledError):
+        client.generate_text("Hi", cancel=cancel)
+    assert client.breaker.state == 'open'
+
+    router = make_router(NamedModel("models/primary"), NamedModel("models/fallback"))
+    router.primary.breaker.state = 'half_open'
+    assert [client.model_name for client in router.route()] == ["models/fallback", "models/primary"]
+    assert router.generate_text("Hi") == "models/fallback reply"
+
+def test_router_stats_track_the_model_not_the_rate_limiter_or_breaker():
+    """Routing latency excludes rate limiter waits; an open breaker isn't counted as a model failure"""
+    router = make_router(NamedModel("models/primary"), NamedModel("models/fallback"), initial_hedge_delay=5)
+    router.primary.limiter = generation.TokenBucket(60, capacity=1)
+    router.primary.limiter.tokens = 0.8
+    assert router.generate_text("Hi") == "models/primary reply"
+    assert list(router.stats["models/primary"].latencies)[0] < 0.1
+
+    router.primary.breaker = generation.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    router.primary.breaker.record_failure()
+    with pytest.raises(generation.CircuitOpenError):
+        router._call(router.primary, threading.Event(), "Hi")
+    assert list(router.stats["models/primary"].outcomes) == [True]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry
+"""
+
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation.metrics import MetricsRegistry, serve_prometheus
+
+def test_counters_and_histograms_export_as_prometheus_text():
+    """Series are kept per label set and exported with cumulative buckets"""
+    registry = MetricsRegistry()
+    registry.inc('model_retries_total', model='fake')
+    registry.inc('model_retries_total', 2, model='fake')
+    for value in (0.002, 0.02, 0.2):
+        registry.observe('model_request_seconds', value, model='fake', outcome='ok')
+
+    text = registry.to_prometheus()
+    assert 'model_retries_total{model="fake"} 3' in text
+    assert 'model_request_seconds_bucket{model="fake",outcome="ok",le="0.005"} 1' in text
+    assert 'model_request_seconds_bucket{model="fake",outcome="ok",le="+Inf"} 3' in text
+    assert 'model_request_seconds_count{model="fake",outcome="ok"} 3' in text
+
+    [row] = registry.summary()
+    assert row['count'] == 3
+    assert row['p50_ms'] == 20.0
+
+def test_label_values_are_escaped():
+    """Backslashes, quotes and newlines in label values don't break the exposition format"""
+    registry = MetricsRegistry()
+    registry.inc('model_errors_total', error='bad "reply"\nC:\\tmp')
+
+    assert 'model_errors_total{error="bad \\"reply\\"\\nC:\\\\tmp"} 1' in registry.to_prometheus()
+
+def test_timer_records_failures_and_logs_jsonl(tmp_path):
+    """Timed blocks are observed even when they raise, and every observation is logged"""
+    log_path = tmp_path / "metrics.jsonl"
+    registry = MetricsRegistry(str(log_path))
+
+    @registry.timed('parse_seconds', parser='follow_ups')
+    def parse():
+        raise ValueError("bad response")
+
+    try:
+        parse()
+    except ValueError:
+        pass
+
+    assert registry.recent_samples('parse_seconds').keys() == {'{parser="follow_ups"}'}
+    [event] = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert event['metric'] == 'parse_seconds' and event['labels'] == {'parser': 'follow_ups'}
+
+def test_prometheus_endpoint_serves_metrics():
+    """The optional HTTP endpoint serves the text format at /metrics, on localhost by default"""
+    registry = MetricsRegistry()
+    registry.inc('page_renders_total')
+    server = serve_prometheus(registry, 0)
+    try:
+        assert server.server_address[0] == '127.0.0.1'
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert 'page_renders_total 1' in response.read().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming prospect import
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import database
+from linkedin_automation.prospect_import import guess_mapping, import_prospects, open_rows
+
+@pytest.fixture
+def campaign_id(db, campaign_data):
+    return database.save_campaign(campaign_data)
+
+def csv_upload(text):
+    return io.BytesIO(("﻿" + text).encode("utf-8"))
+
+def test_guess_mapping_matches_common_headers():
+    """Typical export headers are mapped onto prospect fields"""
+    mapping = guess_mapping(["Full Name", "Job_Title", "Company Name", "LinkedIn URL", "About", "Notes"])
+    assert mapping == {
+        'name': 'Full Name', 'title': 'Job_Title', 'company': 'Company Name',
+        'industry': None, 'profile_summary': 'About', 'recent_activity': None,
+        'profile_url': 'LinkedIn URL'
+    }
+
+def test_csv_import_validates_and_streams_in_chunks(campaign_id):
+    """Valid rows are bulk inserted chunk by chunk and bad rows are reported"""
+    lines = ["Name,Title,Company,LinkedIn URL,Summary"]
+    lines += [f"Person {i},CTO,Acme,https://www.linkedin.com/in/person-{i},\"Builds\nthings\""
+              for i in range(25)]
+    lines += [",CTO,Acme,,", "Bad Url,CTO,Acme,https://example.com/x,"]
+    upload = csv_upload("\n".join(lines) + "\n")
+
+    columns, rows = open_rows(upload, "prospects.csv")
+    assert columns == ["Name", "Title", "Company", "LinkedIn URL", "Summary"]
+
+    progress = []
+    result = import_prospects(rows, guess_mapping(columns), campaign_id, chunk_size=10,
+                              progress_callback=progress.append)
+
+    assert (result.imported, result.skipped) == (25, 2)
+    assert result.errors == [(27, "missing name"), (28, "profile URL is not a LinkedIn URL")]
+    assert progress == [10, 20, 25]
+
+    prospects = database.query("SELECT profile_summary, status FROM prospects WHERE campaign_id = ? ORDER BY id",
+                               (campaign_id,))
+    assert len(prospects) == 25
+    assert prospects[0]['profile_summary'] == "Builds\nthings"
+    assert {row['status'] for row in prospects} == {'pending'}
+
+def test_excel_import(campaign_id):
+    """xlsx uploads are streamed with openpyxl's read-only mode"""
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Name", "Title", "Company", "Industry"])
+    sheet.append(["Anjali Mehta", "HR Manager", "TechStartup Inc", "SaaS"])
+    sheet.append(["Rajesh Kumar", "CTO", "TechStart Solutions", None])
+    upload = io.BytesIO()
+    workbook.save(upload)
+    upload.seek(0)
+
+    columns, rows = open_rows(upload, "prospects.xlsx")
+    result = import_prospects(rows, guess_mapping(columns), campaign_id)
+
+    assert result.imported == 2
+    assert sorted(database.load_prospects_page(campaign_id)['name']) == [
+        "Anjali Mehta", "Rajesh Kumar"]
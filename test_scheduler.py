@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the send queue and daily limits
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from linkedin_automation import cli, database
+from linkedin_automation.scheduler import DailyLimitError, OutreachScheduler
+
+class Clock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+@pytest.fixture
+def campaign_id(db, campaign_data):
+    campaign_id = database.save_campaign(campaign_data)
+    database.save_prospects_bulk([
+        {'name': f'Prospect {i}', 'title': 'CTO', 'company': f'Company {i}', 'industry': 'SaaS',
+         'profile_url': f'https://www.linkedin.com/in/p{i}', 'connection_message': f'Hi {i}',
+         'follow_up_messages': ['One', 'Two', 'Three']}
+        for i in range(20)
+    ], campaign_id)
+    return campaign_id
+
+def test_follow_ups_come_due_on_the_cadence_after_each_send(campaign_id):
+    clock = Clock(datetime(2025, 3, 3, 9, 0))
+    scheduler = OutreachScheduler('free', clock=clock)
+    first = scheduler.due_now()['connection'][0]
+    assert first['name'] == 'Prospect 0'
+    assert scheduler.due_now()['follow_up'] == []
+
+    scheduler.mark_sent('connection', first['prospect_id'])
+    assert database.query("SELECT status FROM prospects WHERE id = ?", (first['prospect_id'],)) == \
+        [{'status': 'sent'}]
+    clock.now += timedelta(days=2)
+    assert scheduler.due_now()['follow_up'] == []
+
+    # Follow-up 1 three days after the connection, follow-up 2 a week after follow-up 1,
+    # even when follow-up 1 went out a day late
+    clock.now += timedelta(days=2)
+    [follow_up] = scheduler.due_now()['follow_up']
+    assert (follow_up['sequence_number'], follow_up['message_content']) == (1, 'One')
+    scheduler.mark_sent('follow_up', follow_up['id'])
+    with pytest.raises(ValueError):
+        scheduler.mark_sent('follow_up', follow_up['id'])
+
+    clock.now += timedelta(days=6)
+    assert scheduler.due_now()['follow_up'] == []
+    clock.now += timedelta(days=1)
+    [follow_up] = scheduler.due_now()['follow_up']
+    assert follow_up['sequence_number'] == 2
+    assert follow_up['scheduled_date'] == (datetime(2025, 3, 7, 9, 0) + timedelta(days=7)).isoformat()
+
+    rows = database.query("SELECT message_type FROM messages WHERE sent_date IS NOT NULL ORDER BY sent_date")
+    assert [row['message_type'] for row in rows] == ['connection', 'follow_up']
+    daily = database.load_daily_stats(campaign_id=campaign_id)
+    assert int(daily['messages_sent'].sum()) == 2
+
+def test_resaving_a_sent_prospect_keeps_it_out_of_the_queue(campaign_id):
+    clock = Clock(datetime(2025, 3, 3, 9, 0))
+    scheduler = OutreachScheduler('free', clock=clock)
+    first = scheduler.due_now()['connection'][0]
+    scheduler.mark_sent('connection', first['prospect_id'])
+
+    # Saved again from Prospect Analysis, with freshly generated messages
+    database.save_prospect({'name': 'Prospect 0', 'title': 'CTO', 'company': 'Company 0', 'industry': 'SaaS',
+                            'profile_url': 'https://www.linkedin.com/in/p0', 'connection_message': 'Hi again',
+                            'follow_up_messages': ['New one', 'New two', 'New three']}, campaign_id)
+
+    assert database.query("SELECT status, connection_message FROM prospects WHERE id = ?",
+                          (first['prospect_id'],)) == [{'status': 'sent', 'connection_message': 'Hi 0'}]
+    assert first['prospect_id'] not in [m['prospect_id'] for m in scheduler.due_now()['connection']]
+    with pytest.raises(ValueError):
+        scheduler.mark_sent('connection', first['prospect_id'])
+    assert scheduler.usage()['connection']['sent'] == 1
+
+    # The scheduled follow-up survives; only the drafts after it are replaced
+    follow_ups = database.query("""
+        SELECT sequence_number, message_content, status FROM messages
+        WHERE prospect_id = ? AND message_type = 'follow_up' ORDER BY sequence_number
+    """, (first['prospect_id'],))
+    assert follow_ups == [{'sequence_number': 1, 'message_content': 'One', 'status': 'scheduled'},
+                          {'sequence_number': 2, 'message_content': 'New two', 'status': 'draft'},
+                          {'sequence_number': 3, 'message_content': 'New three', 'status': 'draft'}]
+    clock.now += timedelta(days=3)
+    assert [m['message_content'] for m in scheduler.due_now()['follow_up']] == ['One']
+
+def test_daily_limits_cap_the_queue_and_refuse_extra_sends(campaign_id):
+    clock = Clock(datetime(2025, 3, 3, 9, 0))
+    scheduler = OutreachScheduler('free', clock=clock)
+    due = scheduler.due_now()['connection']
+    assert len(due) == 15
+
+    for message in due:
+        scheduler.mark_sent('connection', message['prospect_id'])
+    assert scheduler.usage()['connection'] == {'sent': 15, 'limit': 15}
+    assert scheduler.due_now()['connection'] == []
+    with pytest.raises(DailyLimitError):
+        scheduler.mark_sent('connection', due[-1]['prospect_id'] + 1)
+
+    # The rest go out the next day, and a premium account gets the higher limit
+    clock.now += timedelta(days=1)
+    assert len(scheduler.due_now()['connection']) == 5
+    assert OutreachScheduler('premium', clock=clock).usage()['connection'] == {'sent': 0, 'limit': 30}
+
+def test_due_follow_ups_use_the_partial_index(campaign_id):
+    plan = " ".join(row[-1] for row in database.get_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM messages WHERE status = 'scheduled' AND scheduled_date <= ? "
+        "ORDER BY scheduled_date", ('2025-03-03',)).fetchall())
+    assert "USING INDEX idx_messages_due" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_cli_due_lists_the_queue(campaign_id, capsys):
+    assert cli.main(['--db', database.DB_PATH, 'due', '--account-type', 'premium']) == 0
+    output = capsys.readouterr().out
+    assert "connection: 0/30 sent today, 20 due now" in output
+    assert "follow_up: 0/100 sent today, 0 due now" in output